@@ -1,14 +1,31 @@
 import streamlit as st
-import openai
 import json
 import pandas as pd
 from datetime import datetime
-import mysql.connector
-import requests
-import PyPDF2
-import tiktoken
+import threading
+import time
 import os
 
+from chat_budget import DEFAULT_BUDGET, ContextBudget
+from chat_stream import create_chat_stream
+from db_pool import create_pool
+from feishu_client import FeishuClient
+from feishu_queue import FeishuBatchWriter
+from llm_gateway import create_gateway
+from note_summarizer import PENDING_SUMMARY, NoteSummarizer
+from library_search import LibrarySearch, build_library_context, sync_library
+from note_export import FORMATS, export_notes, parquet_available
+from note_queries import LIST_COLUMNS, PAGE_SIZE, ensure_note_indexes, query_note, query_note_page
+from note_tags import add_note_tags, ensure_tag_table, query_tag_counts
+from paper_rag import build_context, get_or_build_index, search_chat
+from paper_store import PaperStore, relink_notes
+from pdf_cache import PREVIEW_CHARS, PdfTextCache, progress_text
+from pdf_preview import thumbnails
+from reader_prompts import (fulltext_overhead_tokens, fulltext_system_message, library_system_message,
+                            rag_system_message)
+from token_utils import CONTEXT_LIMIT, count_tokens
+from usage_stats import DEFAULT_PRICES, ensure_usage_table, load_usage, record_usage, summarize_usage
+
 # --- 1. 页面配置 ---
 st.set_page_config(page_title="pdf_management", page_icon="📕", layout="wide")
 
@@ -19,133 +36,376 @@ if "DEEPSEEK_API_KEY" not in st.secrets:
     st.error("❌ 未找到 API Key，请在 secrets.toml 中配置")
     st.stop()
 
-client = openai.Client(
-    api_key=st.secrets["DEEPSEEK_API_KEY"],
-    base_url="https://api.deepseek.com/v1"
-)
+# 所有 AI 调用都走进程级共享的网关：单次超时、429/5xx 指数退避重试、并发上限、相同请求合并
+# 参数可在 secrets.toml 的 [llm_gateway] 段调整 (max_concurrency / timeout / max_retries ...)
+@st.cache_resource
+def get_llm_gateway():
+    return create_gateway(st.secrets["DEEPSEEK_API_KEY"], st.secrets.get("llm_gateway"))
+
+
+def render_llm_gateway_stats():
+    stats = get_llm_gateway().stats()
+    st.caption(f"🤖 AI 调用 {stats['calls']} 次 | p50 {stats['p50_ms']} ms | p95 {stats['p95_ms']} ms | "
+               f"错误率 {stats['error_rate']:.0%} | 重试 {stats['retries']} | 合并 {stats['coalesced']}")
+
+
+client = get_llm_gateway()
 
 
 # B. 数据库连接
-def get_db_connection():
-    return mysql.connector.connect(
-        host=st.secrets["tidb"]["host"],
-        port=st.secrets["tidb"]["port"],
-        user=st.secrets["tidb"]["user"],
-        password=st.secrets["tidb"]["password"],
-        database=st.secrets["tidb"]["database"]
-    )
+# 进程级连接池：所有会话共用，不再每次请求都重新握手
+@st.cache_resource
+def get_db_pool():
+    return create_pool(st.secrets["tidb"])
+
+
+def render_pool_stats():
+    # 侧边栏显示连接池等待时间，方便观察是否需要调大 pool_size
+    try:
+        stats = get_db_pool().stats()
+    except Exception:
+        st.caption("🔌 连接池未就绪")
+        return
+    st.caption(f"🔌 连接池 {stats['pool_size']} | 平均等待 {stats['avg_wait_ms']} ms | "
+               f"最大等待 {stats['max_wait_ms']} ms | 重连 {stats['reconnects']} 次")
 
 
 # C. 数据库写入 (路由分发)
 def save_to_db(table_name, data_dict):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         if table_name == "paper_notes":
             # 处理列表转字符串
             tags_str = ",".join(data_dict.get('tags', []))
             file_path = data_dict.get('file_path', '')
             summary = data_dict.get('summary', '')  # 获取智能摘要
+            ensure_tag_index()
 
             sql = "INSERT INTO paper_notes (paper_name, question, answer, tags, file_path, summary, log_time) VALUES (%s, %s, %s, %s, %s, %s, %s)"
             val = (data_dict['paper_name'], data_dict['question'], data_dict['answer'], tags_str, file_path, summary,
                    current_time)
-        cursor.execute(sql, val)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # with 保证出错时连接也会归还给连接池
+        with get_db_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, val)
+            data_dict['id'] = cursor.lastrowid  # 后台回写摘要时按 id 更新
+            if table_name == "paper_notes":
+                add_note_tags(cursor, data_dict['id'], data_dict.get('tags', []))  # 同一事务里维护标签索引
+            conn.commit()
+            cursor.close()
         return True
     except Exception as e:
         st.error(f"❌ TiDB 写入失败: {e}")
         return False
 
 
-def load_from_db(table_name):
+# 标签索引：note_tags 倒排表，启动时建表 (首次会从 paper_notes 回填)
+@st.cache_resource
+def ensure_tag_index():
+    ensure_tag_table(get_db_pool())
+    return True
+
+
+@st.cache_data(ttl=300)
+def load_tag_counts():
+    # 标签词表只有几十行，缓存起来；归档新笔记后会主动清掉
     try:
-        conn = get_db_connection()
-        query = f"SELECT * FROM {table_name} ORDER BY log_time DESC"  # 默认倒序
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+        ensure_tag_index()
+        return query_tag_counts(get_db_pool())
+    except Exception:
+        return []
+
+
+# 知识库列表：只查四列、按 (log_time, id) keyset 分页，完整内容点开时才查
+@st.cache_resource
+def ensure_note_index():
+    ensure_note_indexes(get_db_pool())
+    return True
+
+
+def load_note_page(tags, after):
+    try:
+        ensure_note_index()
+    except Exception:
+        pass  # 没有建索引权限也能查，只是慢一点
+    try:
+        return query_note_page(get_db_pool(), tags, after)
+    except Exception:
+        return [], False
+
+
+@st.cache_data(ttl=600, max_entries=64)
+def fetch_note(note_id):
+    # 笔记内容归档后不会再改 (摘要以列表里的为准)，按 id 缓存
+    return query_note(get_db_pool(), note_id)
+
+
+def load_note(note_id):
+    # 查询出错时异常不会被 cache_data 缓存，下次点开还会重新查
+    try:
+        row = fetch_note(note_id)
     except Exception as e:
-        # st.error(f"读取数据失败: {e}") # 生产环境可以注释掉以免干扰
-        return pd.DataFrame()
+        st.error(f"读取笔记失败: {e}")
+        return None
+    if row is None:
+        st.warning("这条笔记已不存在")
+    return row
 
 
 # D. 飞书同步
-def get_feishu_token():
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    req = {
-        "app_id": st.secrets["feishu"]["app_id"],
-        "app_secret": st.secrets["feishu"]["app_secret"]
+# token 有效期约两小时：进程内缓存，快过期时自动刷新，不用每次写入都多一次请求
+@st.cache_resource
+def get_feishu_client():
+    return FeishuClient(st.secrets["feishu"]["app_id"], st.secrets["feishu"]["app_secret"])
+
+
+# 写入队列：按钮回调只负责入队，后台线程攒批后用 batch_create 写入飞书
+@st.cache_resource
+def get_feishu_writer():
+    return FeishuBatchWriter(get_feishu_client(), st.secrets["feishu"]["app_token"])
+
+
+def render_feishu_stats():
+    try:
+        writer = get_feishu_writer()
+    except Exception:
+        return
+    st.caption(f"📮 飞书队列 待发送 {writer.pending()} | 已同步 {writer.sent} | 失败待重放 {writer.spooled()} | 被拒 {writer.rejected}")
+
+
+def paper_feishu_fields(data):
+    return {
+        "文献名": data['paper_name'],
+        "问题": data['question'],
+        "AI解读": data['answer'],
+        "标签": ",".join(data.get('tags', [])),
+        "精简摘要": data.get('summary', ''),
+        "记录时间": int(datetime.now().timestamp() * 1000)
     }
-    resp = requests.post(url, json=req).json()
-    return resp.get("tenant_access_token")
 
 
-def save_to_feishu(type_key, data):
+# 笔记摘要：归档时只写一次 TiDB (占位摘要)，后台攒批生成摘要后回写 TiDB，再同步到飞书
+@st.cache_resource
+def get_note_summarizer():
+    writer = get_feishu_writer()
+    table_id = st.secrets["feishu"]["paper_table_id"]
+    search = get_library_search()
+
+    def sync_to_feishu(note, summary):
+        # 在后台线程里调用，不能用 st.*，所以提前取好 writer、table_id 和检索索引
+        note = dict(note, summary=summary)
+        writer.enqueue(table_id, paper_feishu_fields(note))
+        search.index_note(note)  # 摘要有了，更新全库检索里的这条笔记
+
+    summarizer = NoteSummarizer(get_db_pool(), client, on_done=sync_to_feishu)
     try:
-        token = get_feishu_token()
-        if not token: return False
-        app_token = st.secrets["feishu"]["app_token"]
-        if type_key == "paper":
-            table_id = st.secrets["feishu"]["paper_table_id"]
-            tags_str = ",".join(data.get('tags', []))
-            fields = {
-                "文献名": data['paper_name'],
-                "问题": data['question'],
-                "AI解读": data['answer'],
-                "标签": tags_str,
-                "精简摘要": data.get('summary', ''),
-                "记录时间": int(datetime.now().timestamp() * 1000)
-            }
-
-        url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records"
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        payload = {"fields": fields}
-        resp = requests.post(url, headers=headers, json=payload).json()
-        return resp.get("code") == 0
-    except Exception as e:
-        st.error(f"❌ 飞书同步失败: {e}")
-        return False
+        summarizer.recover()  # 上次没生成完摘要的笔记
+    except Exception:
+        pass
+    return summarizer
+
+
+def render_summarizer_stats():
+    try:
+        summarizer = get_note_summarizer()
+    except Exception:
+        return
+    st.caption(f"📝 摘要 待生成 {summarizer.pending()} | 已完成 {summarizer.done} | 失败 {summarizer.failed}")
+
+
+# E. 本地书架 (内容寻址)：PDF 按 SHA-256 只存一份，文件名只是别名 (见 paper_store)
+@st.cache_resource
+def get_paper_store():
+    store = PaperStore()
+    moved = store.migrate_legacy()  # 老版本按文件名平铺在 paper_library/ 下的 PDF
+    try:
+        relink_notes(get_db_pool(), moved)
+    except Exception:
+        pass  # 改不了也没关系，store.resolve() 能按文件名找回来
+    return store
 
 
-# E. 本地文件管理
 def save_uploaded_file(uploaded_file):
-    library_dir = "paper_library"
-    if not os.path.exists(library_dir):
-        os.makedirs(library_dir)
-    file_path = os.path.join(library_dir, uploaded_file.name)
-    # 4. 【新增功能】检查文件是否已经存在
-    if os.path.exists(file_path):
-        # 如果存在，直接返回路径，并标记 is_new = False
-        return file_path, False
+    # 按 SHA-256 存：同一篇换个名字上传不会再存一份，不同论文同名也不会互相覆盖
+    # 返回 (SHA-256, 路径, 是否新文件)，路径里带着 SHA-256，存进 paper_notes.file_path
+    # 每次聊天 / 点击都会 rerun：同一个上传文件 (file_id 不变) 只在第一次算哈希、存盘，之后直接用记下的结果
+    cached = st.session_state.get("uploaded_pdf")
+    if cached and cached[0] == uploaded_file.file_id:
+        return cached[1], cached[2], False
+    sha, file_path, is_new = get_paper_store().save(uploaded_file, uploaded_file.name)
+    st.session_state.uploaded_pdf = (uploaded_file.file_id, sha, file_path)
+    return sha, file_path, is_new
+
 
-    # 5. 如果不存在，才进行写入操作
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+# 笔记详情里的原始 PDF：缩略图渲染一次存盘；选中笔记时不读 PDF，点了才给文件
+# 渲染出错时异常直接抛出 (cache_data 不缓存异常)，下次还会重试，不会把空结果缓存下来
+@st.cache_data(max_entries=256)
+def load_thumbnails(pdf_path):
+    return thumbnails(pdf_path)
 
-    # 返回路径，并标记 is_new = True (代表是新存的)
-    return file_path, True
 
+def clear_pdf_ready():
+    st.session_state.pop("pdf_ready", None)
 
 
-# F. Token 计数
-def count_tokens(text):
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+def clear_export_file():
+    st.session_state.pop("export_file", None)
+
+
+def render_pdf_preview(pdf_path, row):
+    if st.session_state.get("pdf_ready") not in (None, row['id']):
+        clear_pdf_ready()  # 换了一条笔记，之前准备好的下载作废
+    try:
+        thumbs = load_thumbnails(pdf_path)
+    except Exception:
+        thumbs = []
+    if thumbs:
+        st.image(thumbs, width=120)
+    # 不走 static/ 静态服务：那里不校验登录，拿到链接的人都能下载，原文和导出文件一样只经 download_button 发
+    if st.session_state.get("pdf_ready") == row['id']:
+        # 只有这一次 rerun 会把文件交给 download_button；点了下载就清掉标记，之后的 rerun 不再读文件
+        with open(pdf_path, "rb") as f:
+            st.download_button("📥 下载原始 PDF", f, file_name=row['paper_name'],
+                               mime="application/pdf", on_click=clear_pdf_ready)
+    elif st.button("📥 准备下载原始 PDF", key=f"prepare_pdf_{row['id']}"):
+        st.session_state.pdf_ready = row['id']  # 只有当前这条会被读进内存
+        st.rerun()
 
 
 # --- 功能模块 文献阅读：
-@st.cache_data
-def extract_text_from_pdf(uploaded_file):
-    pdf_reader = PyPDF2.PdfReader(uploaded_file)
-    text = ""
-    for i, page in enumerate(pdf_reader.pages):
-        c = page.extract_text()
-        if c: text += f"\n\n--- [第 {i + 1} 页] ---\n\n{c}"
-    return text
+# 解析结果按 PDF 内容的 SHA-256 缓存到 paper_library/.text_cache/，重启后也不用重新解析
+# 解析后端可在 secrets.toml 里用 pdf_backend 切换 (pypdf2 / pypdf / pymupdf)
+@st.cache_resource
+def get_pdf_cache():
+    return PdfTextCache(backend=st.secrets.get("pdf_backend", "pypdf2"))
+
+
+def pdf_progress_callback():
+    """边解析边显示进度、已估算的 Token 和首页预览 (只有第一次解析时才会出现)"""
+    progress = st.empty()
+    preview = st.empty()
+
+    def on_page(page_no, total, pages, tokens):
+        if len(pages) == 1:
+            preview.caption(pages[0][1][:PREVIEW_CHARS])
+        progress.progress(page_no / total, text=progress_text(page_no, total, tokens))
+
+    def done():
+        progress.empty()
+        preview.empty()
+
+    return on_page, done
+
+
+def extract_pdf(uploaded_file, sha=None):
+    # 返回 {"sha256", "text", "tokens", "pages"}，text 每页前带 [第 N 页] 标记
+    on_page, done = pdf_progress_callback()
+    entry = get_pdf_cache().extract(uploaded_file.getvalue(), on_page=on_page, sha=sha)
+    done()
+    return entry
+
+
+# F. 全库检索：书架上所有 PDF (按页) + 全部笔记的本地 FTS5 索引，存在 paper_library/.index/library.sqlite3
+LIBRARY_TOP_K = 8
+
+
+@st.cache_resource
+def get_library_search():
+    search = LibrarySearch()
+    pool, pdf_cache, store = get_db_pool(), get_pdf_cache(), get_paper_store()
+
+    def bootstrap():
+        # 补齐还没索引的 PDF 和笔记，后台慢慢做，不挡页面
+        try:
+            sync_library(search, pool, pdf_cache, store)
+        except Exception:
+            pass
+
+    threading.Thread(target=bootstrap, name="library-sync", daemon=True).start()
+    return search
+
+
+def render_library_search():
+    st.header("🔎 全库检索")
+    search = get_library_search()
+    stats = search.stats()
+    st.caption(f"已索引 {stats['pdfs']} 篇论文 | {stats['notes']} 条笔记 | {stats['passages']} 个片段")
+    with st.form("library_search"):
+        query = st.text_input("在整个书架和笔记里搜索", placeholder="例如：PD-1 抑制剂的不良反应")
+        col_s, col_a = st.columns(2)
+        do_search = col_s.form_submit_button("🔍 搜索")
+        do_ask = col_a.form_submit_button("🤖 基于全库回答")
+    if not query or not (do_search or do_ask):
+        return
+
+    start = time.perf_counter()
+    hits = search.search(query, k=LIBRARY_TOP_K)
+    elapsed = (time.perf_counter() - start) * 1000
+    if not hits:
+        st.info("书架和笔记里没有找到相关内容")
+        return
+    st.caption(f"找到 {len(hits)} 个相关片段，用时 {elapsed:.1f} ms")
+
+    if do_ask:
+        # 跨论文问答：把命中的片段 (标明论文和页码) 发给 AI
+        with st.chat_message("assistant"):
+            try:
+                messages = [library_system_message(build_library_context(hits)),
+                            {"role": "user", "content": query}]
+                st.write_stream(create_chat_stream(client, messages))
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    for hit in hits:
+        source = f"📄 {hit['title']} · 第 {hit['page']} 页" if hit["kind"] == "pdf" else f"📝 笔记 · {hit['title']}"
+        st.markdown(f"**{source}**  \n{hit['snippet']}")
+
+
+# G. 检索索引：按论文内容哈希持久化在 paper_library/.index/ 下
+@st.cache_resource(max_entries=20)
+def get_paper_index(pdf_sha, _paper_text):
+    # 下划线开头的参数不参与缓存 key 的哈希，只用 PDF 的 SHA-256 做 key
+    return get_or_build_index(_paper_text, key=pdf_sha)
+
+
+# H. 前缀缓存命中统计：每次问答后按论文把命中 / 未命中 Token 记到 TiDB 的 llm_usage 表
+@st.cache_resource
+def get_usage_pool():
+    pool = get_db_pool()
+    ensure_usage_table(pool)
+    return pool
+
+
+def record_reader_usage(pdf_sha, paper_name, usage):
+    try:
+        record_usage(get_usage_pool(), "app_pdf_management", pdf_sha, paper_name, usage)
+    except Exception:
+        pass  # 统计失败不影响问答
+
+
+@st.cache_data(ttl=60)
+def load_usage_stats(days=30):
+    return load_usage(get_usage_pool(), days)
+
+
+def render_prompt_cache_stats():
+    # 侧边栏：近 30 天的前缀缓存命中率和省下的钱，看缓存到底有没有生效 (数字由 usage_stats 统一算)
+    try:
+        daily, papers = load_usage_stats()
+    except Exception:
+        st.caption("📊 缓存统计未就绪")
+        return
+    if not daily:
+        st.caption("📊 暂无前缀缓存记录")
+        return
+    summary = summarize_usage(daily, papers, dict(DEFAULT_PRICES, **st.secrets.get("deepseek_prices", {})))
+    st.markdown("#### 📊 前缀缓存 (近 30 天)")
+    c1, c2 = st.columns(2)
+    c1.metric("命中率", f"{summary['hit_rate']:.0%}" if summary["hit_rate"] is not None else "-")
+    c2.metric("已节省", f"${summary['saved']:.3f}")
+    st.line_chart(pd.Series(summary["daily_rate"]), height=120)
+    with st.expander("按论文查看"):
+        st.dataframe(pd.DataFrame(summary["papers"]), hide_index=True)
 
 
 def render_med_reader():
@@ -154,16 +414,10 @@ def render_med_reader():
     if "init_done" not in st.session_state:
         st.session_state.chat_history = []
         default_tags = []
-        # 从数据库捞标签
-        df_history = load_from_db("paper_notes")
-        db_tags = set()
-        if not df_history.empty and 'tags' in df_history.columns:
-            for tag_str in df_history['tags']:
-                if tag_str:
-                    for p in tag_str.split(","):
-                        if p.strip(): db_tags.add(p.strip())
-
-        all_tags = list(set(default_tags + list(db_tags)))
+        # 从标签索引捞标签 (一条走索引的小查询)
+        db_tags = [tag for tag, _ in load_tag_counts()]
+
+        all_tags = list(set(default_tags + db_tags))
         all_tags.sort()
         st.session_state.all_tags = all_tags
         st.session_state.init_done = True
@@ -172,9 +426,11 @@ def render_med_reader():
     with st.sidebar:
         st.markdown("### 📥 文献上传")
         uploaded_file = st.file_uploader("Upload PDF", type="pdf")
+        st.toggle("🔎 检索模式 (RAG)", value=True, key="rag_mode",
+                  help="开启：只发送与问题相关的片段，省 Token、支持超长论文；关闭：发送全文")
         if uploaded_file:# 自动保存到本地书架
-            # ✅ 修复点：使用两个变量来接收返回的两个值
-            saved_path, is_new = save_uploaded_file(uploaded_file)
+            # ✅ 修复点：用三个变量接收返回的 (SHA-256, 路径, 是否新文件)
+            pdf_sha, saved_path, is_new = save_uploaded_file(uploaded_file)
 
             # 只把路径存入 session
             st.session_state.current_file_path = saved_path
@@ -191,8 +447,11 @@ def render_med_reader():
                 st.toast("新文献已加载，记忆重置")
 
             # 提取文本
-            paper_text = extract_text_from_pdf(uploaded_file)
-            tokens = count_tokens(paper_text)
+            pdf = extract_pdf(uploaded_file, pdf_sha)
+            paper_text = pdf["text"]
+            # 加入全库检索 (同一篇 PDF 只索引一次)
+            get_library_search().index_pdf(pdf["sha256"], uploaded_file.name, saved_path, paper_text)
+            tokens = pdf["tokens"]  # 提取时已按页算好并缓存，rerun 不用重算
             st.success(f"已解析: {len(paper_text)} 字符")
             st.caption(f"Token 估算: {tokens}")
             if len(paper_text) > 2000:
@@ -214,50 +473,72 @@ def render_med_reader():
                 st.write(query)
             st.session_state.chat_history.append({"role": "user", "content": query})
 
-            # 构造带缓存的消息链
-            messages = [
-                           {"role": "system",
-                            "content": f"""
-                            你是一个严谨的医学科研助手。
-                             1. 请基于我提供的【论文内容】回答问题。
-                             2. **必须引用原文**：在回答的关键观点后，请标注出处，例如 (见第 3 页)。
-                             3. 如果论文中没有相关信息，请直接回答“文中未提及”，不要编造。
-                             4. 保持回答的逻辑性，使用 Markdown 格式（如列表、粗体）。
-                            【论文全文】：
-                            {paper_text}
-                            """},
-                       ]
-            messages.extend(st.session_state.chat_history)
+            # 上下文预算：超出时较早的对话先压缩成摘要 (接在论文后面)，只保留最近几轮原文
+            if "context_budget" not in st.session_state:
+                st.session_state.context_budget = ContextBudget(st.secrets.get("chat_context_budget", DEFAULT_BUDGET))
+            budget = st.session_state.context_budget
+            use_rag = st.session_state.get("rag_mode", True)
+            if not use_rag and not budget.fits(tokens + fulltext_overhead_tokens()):
+                # 论文全文本身就超出预算，压缩聊天记录也放不下，这一轮改用检索片段
+                use_rag = True
+                st.toast("论文全文超出上下文预算，本轮改用检索模式")
+            if use_rag:
+                # 检索模式：只把和问题最相关的几个片段 (带页码) 发给 AI，长论文也不会超出上下文
+                index = get_paper_index(pdf["sha256"], paper_text)
+                # 追问时带上上一个问题一起检索 (paper_rag.search_chat)
+                hits = search_chat(index, st.session_state.chat_history)
+                system_message = rag_system_message(build_context(hits))
+                # 片段只有几千字，直接数
+                system_tokens = count_tokens(system_message["content"])
+            else:
+                hits = []
+                # 全文模式：构造带缓存的消息链
+                # 全文模式：system 消息由 reader_prompts 统一构造，和 app_pdf_plus 字节一致，前缀缓存可以共用
+                system_message = fulltext_system_message(paper_text)
+                # 全文的 Token 用缓存里的，只给指令模板计数
+                system_tokens = tokens + fulltext_overhead_tokens()
+            folded = budget.start
+            with st.spinner("正在整理上下文..."):
+                messages, payload_tokens = budget.build(system_message, system_tokens,
+                                                        st.session_state.chat_history, client)
+            if budget.start > folded:
+                st.toast(f"对话较长，已把前 {budget.start} 条记录压缩成摘要")
+            if payload_tokens > CONTEXT_LIMIT:
+                st.warning(f"⚠️ 本次请求约 {payload_tokens:,} Token，超过 DeepSeek 64k 上下文上限，可能会被截断或报错。")
             with st.chat_message("assistant"):
-                with st.spinner("AI 思考中..."):
-                    try:
-                        resp = client.chat.completions.create(
-                            model="deepseek-chat", messages=messages, temperature=0.1
-                        )
-                        ans = resp.choices[0].message.content
-                        st.markdown(ans)
-                        st.session_state.chat_history.append({"role": "assistant", "content": ans})
-
-                        # 费用统计
-                        if resp.usage:
-                            prompt_tokens = resp.usage.prompt_tokens  # 提问消耗 (PDF + 问题)
-                            completion_tokens = resp.usage.completion_tokens  # 回答消耗 (AI 写的字)
-                            # 缓存命中的 Token 数量 (Cache Hit)
-                            cached_tokens = resp.usage.prompt_cache_hit_tokens
-                            # 实际扣费的 Token 数量 (Cache Miss)
-                            miss_tokens = resp.usage.prompt_cache_miss_tokens
-                            total = resp.usage.total_tokens
-
-                            st.caption(f"""
-                            💰 **DeepSeek 缓存统计**:
-                            - 📥 阅读 (Input): `{prompt_tokens}` Tokens
-                            - ✅ 命中缓存: `{cached_tokens}` Tokens 
-                            - 🆕 新增读取: `{miss_tokens}` Tokens 
-                            - 📤 思考 (Output): `{completion_tokens}` Tokens
-                            - 💰 总计 (Total): `{total}` Tokens
-                            """)
-                    except Exception as e:
-                        st.error(f"Error: {e}")
+                try:
+                    with st.spinner("AI 思考中..."):
+                        chat = create_chat_stream(client, messages)
+                    # 流式输出：边生成边显示
+                    ans = st.write_stream(chat)
+                    if hits:
+                        pages = sorted({chunk["page"] for _, chunk in hits})
+                        st.caption(f"📑 检索片段来自第 {', '.join(map(str, pages))} 页")
+                    st.session_state.chat_history.append({"role": "assistant", "content": ans})
+
+                    # 费用统计
+                    if chat.usage:
+                        prompt_tokens = chat.usage.prompt_tokens  # 提问消耗 (PDF + 问题)
+                        completion_tokens = chat.usage.completion_tokens  # 回答消耗 (AI 写的字)
+                        # 缓存命中的 Token 数量 (Cache Hit)
+                        cached_tokens = chat.usage.prompt_cache_hit_tokens
+                        # 实际扣费的 Token 数量 (Cache Miss)
+                        miss_tokens = chat.usage.prompt_cache_miss_tokens
+                        total = chat.usage.total_tokens
+
+                        st.caption(f"""
+                        💰 **DeepSeek 缓存统计**:
+                        - ⚡ 首字延迟: `{chat.first_token_latency or 0:.2f}` 秒 (总耗时 `{chat.total_latency or 0:.2f}` 秒)
+                        - 📥 阅读 (Input): `{prompt_tokens}` Tokens
+                        - ✅ 命中缓存: `{cached_tokens}` Tokens 
+                        - 🆕 新增读取: `{miss_tokens}` Tokens 
+                        - 📤 思考 (Output): `{completion_tokens}` Tokens
+                        - 💰 总计 (Total): `{total}` Tokens
+                        - 📏 上下文预算: 本轮发送约 `{payload_tokens}` / `{budget.budget}` Tokens (已压缩 `{budget.start}` 条早期对话)
+                        """)
+                        record_reader_usage(pdf["sha256"], uploaded_file.name, chat.usage)
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
     #  3. 笔记保存区 (升级版：支持自定义标签)
         st.divider()
@@ -283,91 +564,108 @@ def render_med_reader():
                             if t not in st.session_state.all_tags:
                                 st.session_state.all_tags.append(t)
 
-                         # 生成 One-Liner 摘要
-                        summary_text = ""
-                        with st.spinner("正在生成精简摘要..."):
-                            try:
-                                sum_resp = client.chat.completions.create(
-                                model="deepseek-chat",
-                                messages=[{"role": "user",
-                                                   "content": f"请为以下问答生成一个20字以内的核心结论摘要，不要标点：\n问：{last_q}\n答：{last_a}"}],
-                                            temperature=0.1
-                                        )
-                                summary_text = sum_resp.choices[0].message.content.strip()
-                            except:
-                                summary_text = "摘要生成失败"
-                                # 存库
-                            data = {
-                                "paper_name": p_name, "question": last_q, "answer": last_a,
-                                "tags": final_tags, "summary": summary_text,
-                                "file_path": st.session_state.get("current_file_path", "")
-                                }
-
-                            if save_to_db("paper_notes", data) and save_to_feishu("paper", data):
-                                st.success(f"已归档！摘要: {summary_text}")
-
-                            else:
-                                 st.error("保存失败")
-
-    # 4. 知识库浏览区 (分栏 + 交互 + 下载)
+                        # 先带占位摘要存库，One-Liner 摘要由后台生成后回写 TiDB 并同步飞书
+                        data = {
+                            "paper_name": p_name, "question": last_q, "answer": last_a,
+                            "tags": final_tags, "summary": PENDING_SUMMARY,
+                            "file_path": st.session_state.get("current_file_path", "")
+                        }
+                        if save_to_db("paper_notes", data):
+                            get_note_summarizer().submit(data)
+                            get_library_search().index_note(data)
+                            load_tag_counts.clear()  # 标签计数变了
+                            st.success("已归档！精简摘要正在后台生成，稍后刷新即可看到")
+
+    # 4. 全库检索 (所有论文 + 笔记)
+    render_library_search()
+
+    # 5. 知识库浏览区 (分栏 + 交互 + 下载)
     st.header("📚 科研知识库")
-    df = load_from_db("paper_notes")
-
-    if not df.empty:
-        # 数据清洗
-        if 'tags' not in df.columns: df['tags'] = ""
+    # 标签筛选器：标签和计数来自 note_tags 索引，筛选在 SQL 里完成
+    tag_counts = dict(load_tag_counts())
+    with st.expander("🔍 筛选与导出"):
+        col_f1, col_f2 = st.columns(2)
+        filter_tags = col_f1.multiselect("按标签筛选", list(tag_counts),
+                                         format_func=lambda t: f"{t} ({tag_counts[t]})")
+        # 导出：点了才从 TiDB 分块流式写文件，平时渲染页面不做任何序列化
+        formats = list(FORMATS) if parquet_available() else ["CSV"]
+        export_fmt = col_f2.radio("导出格式", formats, horizontal=True)
+        incremental = col_f2.checkbox("只导出上次导出之后的新笔记", disabled=bool(filter_tags),
+                                      help="按标签筛选时导出的是筛选结果，不参与增量")
+        if col_f2.button("📤 导出备份"):
+            try:
+                with st.spinner("正在导出..."):
+                    path, count = export_notes(get_db_pool(), export_fmt, filter_tags,
+                                               incremental and not filter_tags)
+                st.session_state.export_file = (path, count)
+            except Exception as e:
+                st.error(f"导出失败: {e}")
+        if "export_file" in st.session_state:
+            path, count = st.session_state.export_file
+            if not path:
+                col_f2.info("没有需要导出的新笔记")
+            elif os.path.exists(path):
+                # 导出的是整个知识库，不放到 static/ 下公开；点了下载就清掉，之后的 rerun 不再读文件
+                with open(path, "rb") as f:
+                    col_f2.download_button(f"📥 下载 {os.path.basename(path)} ({count} 条)", f,
+                                           os.path.basename(path), on_click=clear_export_file)
+
+    # 分页游标：kb_cursors[i] 是第 i 页之前最后一条的 (log_time, id)，换了筛选条件就回到第一页
+    if st.session_state.get("kb_filter") != filter_tags:
+        st.session_state.kb_filter = filter_tags
+        st.session_state.kb_cursors = [None]
+    cursors = st.session_state.kb_cursors
+    rows, has_more = load_note_page(tuple(filter_tags), cursors[-1])
+
+    if rows:
+        df = pd.DataFrame(rows, columns=LIST_COLUMNS)
         df['tags'] = df['tags'].fillna("")
-        if 'summary' not in df.columns: df['summary'] = ""
         df['summary'] = df['summary'].fillna("无摘要")
 
-        # 标签筛选器
-        all_db_tags = set(t for s in df['tags'] for t in s.split(",") if t)
-        with st.expander("🔍 筛选与导出"):
-            col_f1, col_f2 = st.columns(2)
-            filter_tags = col_f1.multiselect("按标签筛选", list(all_db_tags))
-
-            # 导出 CSV
-            csv = df.to_csv(index=False).encode('utf-8-sig')
-            col_f2.download_button("📤 导出备份 (CSV)", csv, "medical_notes.csv", "text/csv")
-
-        # 应用筛选
-        if filter_tags:
-            df = df[df['tags'].apply(lambda x: any(t in x.split(",") for t in filter_tags))]
-
         # 分栏布局
         col_list, col_detail = st.columns([2, 3])
 
         with col_list:
-            st.caption(f"共 {len(df)} 条笔记")
-            # 交互式表格
+            # 翻页
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            if col_prev.button("⬅️ 上一页", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+            col_page.caption(f"第 {len(cursors)} 页 (每页 {PAGE_SIZE} 条)")
+            if col_next.button("下一页 ➡️", disabled=not has_more):
+                last = rows[-1]
+                cursors.append((last['log_time'], last['id']))
+                st.rerun()
+            # 交互式表格：只有列表需要的四列
             event = st.dataframe(
                 df,
                 column_config={
                     "id": st.column_config.NumberColumn("ID", width="small"),
                     "summary": st.column_config.TextColumn("📌 核心结论", width="large"),
                     "tags": st.column_config.TextColumn("标签", width="medium"),
-                    # ✅ 修复后的写法：直接设为 None 即可隐藏
-                    "paper_name": None,
-                    "question": None,
-                    "answer": None,
-                    "file_path": None
+                    "log_time": st.column_config.DatetimeColumn("时间", format="YYYY-MM-DD HH:mm"),
                 },
-                use_container_width=True, hide_index=True, selection_mode="single-row", on_select="rerun", height=600
+                use_container_width=True, hide_index=True, selection_mode="single-row", on_select="rerun", height=600,
+                key=f"kb_table_{len(cursors)}"  # 翻页后选中状态不沿用到新的一页
             )
 
         with col_detail:
             if len(event.selection.rows) > 0:
-                row = df.iloc[event.selection.rows[0]]
+                item = df.iloc[event.selection.rows[0]]
+                # 点开时才按 id 取完整内容 (问题、回答、文件路径)
+                row = load_note(int(item['id']))
+                if row is None:
+                    return
                 with st.container(border=True):
                     # 详情卡片
                     st.markdown(f"### 📄 {row['paper_name']}")
-                    if row['tags']:
+                    if item['tags']:
                         # 渲染标签
-                        tags_html = " ".join([f"`{t}`" for t in row['tags'].split(",") if t])
+                        tags_html = " ".join([f"`{t}`" for t in item['tags'].split(",") if t])
                         st.markdown(f"🏷️ {tags_html}")
 
                     st.divider()
-                    st.info(f"📌 **摘要**: {row['summary']}")
+                    st.info(f"📌 **摘要**: {item['summary']}")
                     st.markdown("#### ❓ 问题");
                     st.write(row['question'])
                     st.markdown("#### 🤖 解读");
@@ -375,9 +673,9 @@ def render_med_reader():
 
                     st.divider()
                     # 原始文件下载
-                    if row['file_path'] and os.path.exists(row['file_path']):
-                        with open(row['file_path'], "rb") as f:
-                            st.download_button("📥 打开/下载原始 PDF", f, file_name=row['paper_name'])
+                    pdf_path = get_paper_store().resolve(row['file_path'])
+                    if pdf_path:
+                        render_pdf_preview(pdf_path, row)
                     else:
                         st.caption("⚠️ 原始文件未在本地找到 (仅显示云端笔记)")
             else:
@@ -387,6 +685,12 @@ def render_med_reader():
 def main():
     # 必须在这里调用你的核心界面函数，页面才会显示东西
     render_med_reader()
+    with st.sidebar:
+        render_pool_stats()
+        render_llm_gateway_stats()
+        render_feishu_stats()
+        render_summarizer_stats()
+        render_prompt_cache_stats()
 
 # ⚠️ 注意：下面的 if 必须顶格写，不要缩进！
 if __name__ == "__main__":
@@ -1,12 +1,27 @@
 import streamlit as st
-import openai
-import json
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
 from datetime import datetime
-import mysql.connector
-import requests
-import PyPDF2  # <--- 新引入的“显微镜”，用于读取 PDF
-import tiktoken # 引入消耗的token计算
+import threading
+
+from chat_budget import DEFAULT_BUDGET, ContextBudget
+from chat_stream import create_chat_stream
+from db_pool import create_pool
+from dual_write import DualWriter
+from feishu_client import FeishuClient
+from feishu_queue import FeishuBatchWriter
+from health_frames import daily_trend, history_start, load_log_frame, top_foods
+from health_queries import NAME_COLUMNS, DailyTotalsCache, ensure_log_time_indexes, existing_log_names
+from llm_cache import LLMCache
+from llm_gateway import create_gateway
+from llm_json import ExerciseInfo, FoodInfo, ask_json, parse_object
+from local_lookup import LocalLookup
+from meal_parser import MEAL_PROMPT, is_multi_item, parse_meal_items, split_items
+from paper_rag import build_context, get_or_build_index, search_chat
+from pdf_cache import PREVIEW_CHARS, PdfTextCache, progress_text
+from reader_prompts import fulltext_overhead_tokens, fulltext_system_message, rag_system_message
+from token_utils import CONTEXT_LIMIT, count_tokens
+from usage_stats import DEFAULT_PRICES, ensure_usage_table, load_usage, record_usage, summarize_usage
 
 # --- 1. 页面基础配置 ---
 st.set_page_config(page_title="Dr. AI 个人助手", page_icon="👨‍⚕️", layout="wide")
@@ -19,33 +34,77 @@ if "DEEPSEEK_API_KEY" not in st.secrets:
     st.error("未找到 API Key，请配置 secrets.toml")
     st.stop()
 
-client = openai.Client(
-    api_key=st.secrets["DEEPSEEK_API_KEY"],
-    base_url="https://api.deepseek.com/v1"
-)
+# 所有 AI 调用都走进程级共享的网关：单次超时、429/5xx 指数退避重试、并发上限、相同请求合并
+# 参数可在 secrets.toml 的 [llm_gateway] 段调整 (max_concurrency / timeout / max_retries ...)
+@st.cache_resource
+def get_llm_gateway():
+    return create_gateway(st.secrets["DEEPSEEK_API_KEY"], st.secrets.get("llm_gateway"))
+
+
+def render_llm_gateway_stats():
+    stats = get_llm_gateway().stats()
+    st.caption(f"🤖 AI 调用 {stats['calls']} 次 | p50 {stats['p50_ms']} ms | p95 {stats['p95_ms']} ms | "
+               f"错误率 {stats['error_rate']:.0%} | 重试 {stats['retries']} | 合并 {stats['coalesced']}")
+
+
+client = get_llm_gateway()
 
 
 # B. 数据库连接工具
-def get_db_connection():
-    return mysql.connector.connect(
-        host=st.secrets["tidb"]["host"],
-        port=st.secrets["tidb"]["port"],
-        user=st.secrets["tidb"]["user"],
-        password=st.secrets["tidb"]["password"],
-        database=st.secrets["tidb"]["database"]
-    )
+# 进程级连接池：所有会话共用，不再每次请求都重新握手
+@st.cache_resource
+def get_db_pool():
+    return create_pool(st.secrets["tidb"])
+
+
+def render_pool_stats():
+    # 侧边栏显示连接池等待时间，方便观察是否需要调大 pool_size
+    try:
+        stats = get_db_pool().stats()
+    except Exception:
+        st.caption("🔌 连接池未就绪")
+        return
+    st.caption(f"🔌 连接池 {stats['pool_size']} | 平均等待 {stats['avg_wait_ms']} ms | "
+               f"最大等待 {stats['max_wait_ms']} ms | 重连 {stats['reconnects']} 次")
 
 
 # C. 飞书工具
-def get_feishu_token():
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"  # 注意：通常是 tenant_access_token
-    req = {
-        "app_id": st.secrets["feishu"]["app_id"],
-         "app_secret": st.secrets["feishu"]["app_secret"]
-        }
-    resp = requests.post(url, json=req).json()
-    return resp.get("tenant_access_token")
+# token 有效期约两小时：进程内缓存，快过期时自动刷新，不用每次写入都多一次请求
+@st.cache_resource
+def get_feishu_client():
+    return FeishuClient(st.secrets["feishu"]["app_id"], st.secrets["feishu"]["app_secret"])
+
+
+# 写入队列：按钮回调只负责入队，后台线程攒批后用 batch_create 写入飞书
+@st.cache_resource
+def get_feishu_writer():
+    return FeishuBatchWriter(get_feishu_client(), st.secrets["feishu"]["app_token"])
+
+
+def render_feishu_stats():
+    try:
+        writer = get_feishu_writer()
+    except Exception:
+        return
+    st.caption(f"📮 飞书队列 待发送 {writer.pending()} | 已同步 {writer.sent} | 失败待重放 {writer.spooled()} | 被拒 {writer.rejected}")
 # ---3. 调用ai工具函数---
+# 本地营养 / 运动数据库：常见输入直接查表，不走 API
+@st.cache_resource
+def get_local_lookup():
+    return LocalLookup.from_dir()
+
+
+# AI 结果缓存：同样的输入 (归一化后) 直接复用，不再调 API
+@st.cache_resource
+def get_llm_cache():
+    return LLMCache(**st.secrets.get("llm_cache", {}))
+
+
+def render_llm_cache_stats():
+    stats = get_llm_cache().stats()
+    st.caption(f"🧠 AI 缓存 命中 {stats['hits']} | 未命中 {stats['misses']} | 命中率 {stats['hit_rate']}%")
+
+
 def get_food_info(user_input):
     system_prompt = """
     You are a nutritionist. Analyze user input and return JSON.
@@ -59,17 +118,18 @@ def get_food_info(user_input):
         "tips": "One short health advice in English"
     }
     """
+    # 先查本地库，查不到或把握不大再走缓存 / AI
+    local = get_local_lookup().lookup_food(user_input)
+    if local:
+        return local
+    cached = get_llm_cache().get("food", user_input)
+    if cached:
+        return cached
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            temperature=0.1
-        )
-        content = response.choices[0].message.content.replace("```json", "").replace("```", "")
-        return json.loads(content)
+        # JSON 模式 + 类型校验，格式不对时让 AI 修一次
+        result = ask_json(client, system_prompt, user_input, lambda c: parse_object(FoodInfo, c))
+        get_llm_cache().set("food", user_input, result)
+        return result
     except Exception as e:
         st.error(f"AI 连接超时或出错: {e}")
         return None
@@ -86,112 +146,193 @@ def get_exercise_info(user_input):
         "tips": "Short recovery advice in English"
     }
     """
+    local = get_local_lookup().lookup_exercise(user_input, st.secrets.get("body_weight_kg", 60))
+    if local:
+        return local
+    cached = get_llm_cache().get("exercise", user_input)
+    if cached:
+        return cached
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            temperature=0.1
-        )
-        content = response.choices[0].message.content.replace("```json", "").replace("```", "")
-        return json.loads(content)
+        # JSON 模式 + 类型校验，格式不对时让 AI 修一次
+        result = ask_json(client, system_prompt, user_input, lambda c: parse_object(ExerciseInfo, c))
+        get_llm_cache().set("exercise", user_input, result)
+        return result
     except Exception as e:
         st.error(f"AI Error: {e}")
         return None
 
-def count_tokens(text):
-    """【新增】计算文本的 Token 数量"""
-    # 使用 cl100k_base 编码器 (目前大多数先进模型通用的编码标准)
-    encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(text))
-    return num_tokens
+
+def get_meal_items(user_input):
+    """一餐多样食物：一次请求返回数组，逐条校验"""
+    # 每样都能在本地库查到就不调 API
+    local = [get_local_lookup().lookup_food(p) for p in split_items(user_input)]
+    if local and all(local):
+        return local
+    cached = get_llm_cache().get("meal", user_input)
+    if cached:
+        return cached
+    try:
+        items, invalid = ask_json(client, MEAL_PROMPT, user_input, parse_meal_items)
+        if invalid:
+            st.warning(f"有 {invalid} 条结果格式不对，已跳过")
+        if items:
+            get_llm_cache().set("meal", user_input, items)
+        return items
+    except Exception as e:
+        st.error(f"AI 连接超时或出错: {e}")
+        return []
 
 # ---4. 数据保存函数---
-def save_to_db(table_name, data_dict):
+def save_to_db(table_name, data_dict, log_time=None):
+    # data_dict 也可以是 list：一餐多样食物用 executemany 一次写入
+    # log_time 由双写调度统一给出，对账补写时沿用原来的时间
+    rows = data_dict if isinstance(data_dict, list) else [data_dict]
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = log_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         if table_name == "diet_log":
             sql = "INSERT INTO diet_log (food_name, calories, protein, carbohydrate, fat, tips, log_time) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-            val = (data_dict['food_name'], data_dict['calories'], data_dict['protein'],
-                   data_dict.get('carbohydrate', 0), data_dict.get('fat', 0),  # 使用 .get 防止 AI 没返回这些字段报错
-                   data_dict['tips'], current_time)
+            vals = [(d['food_name'], d['calories'], d['protein'],
+                     d.get('carbohydrate', 0), d.get('fat', 0),  # 使用 .get 防止 AI 没返回这些字段报错
+                     d['tips'], current_time) for d in rows]
 
         elif table_name == "exercise_log":
             sql = "INSERT INTO exercise_log (exercise_name, duration, calories_burned, tips, log_time) VALUES (%s, %s, %s, %s, %s)"
-            val = (data_dict['exercise_name'], data_dict['duration'], data_dict['calories_burned'],
-                   data_dict['tips'], current_time)
-
-        cursor.execute(sql, val)
-        conn.commit()
-        cursor.close()
-        conn.close()
+            vals = [(d['exercise_name'], d['duration'], d['calories_burned'],
+                     d['tips'], current_time) for d in rows]
+
+        # with 保证出错时连接也会归还给连接池
+        with get_db_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(sql, vals)
+            conn.commit()
+            cursor.close()
         return True  # <--- 关键修复：必须返回 True
     except Exception as e:
         st.error(f"❌ TiDB 写入失败: {e}")
         return False
 def save_to_feishu(type_key, data):
+    # data 也可以是 list：一餐多条记录一起入队，合并成一个 batch_create 请求
+    records = data if isinstance(data, list) else [data]
     try:
-        token = get_feishu_token()
-        if not token:
-            st.error("飞书 Token 获取失败")
-            return False
-
-        app_token = st.secrets["feishu"]["app_token"]
-
+        log_time = int(datetime.now().timestamp() * 1000)  # 飞书日期通常接受毫秒时间戳
         # 关键修复：统一转为小写比较，防止 Diet != diet
         if type_key.lower() == "diet":
             table_id = st.secrets["feishu"]["diet_table_id"]
-            fields = {
-                "food_name": data['food_name'],
-                "calories": data['calories'],
-                "protein": data['protein'],
-                "carbohydrate": data.get('carbohydrate', 0),
-                "fat": data.get('fat', 0),
-                "tips": data['tips'],
-                "log_time": int(datetime.now().timestamp() * 1000)  # 飞书日期通常接受毫秒时间戳
-            }
+            fields_list = [{
+                "food_name": d['food_name'],
+                "calories": d['calories'],
+                "protein": d['protein'],
+                "carbohydrate": d.get('carbohydrate', 0),
+                "fat": d.get('fat', 0),
+                "tips": d['tips'],
+                "log_time": log_time
+            } for d in records]
         else:
             table_id = st.secrets["feishu"]["ex_table_id"]
-            fields = {
-                "exercise_name": data['exercise_name'],
-                "duration": data['duration'],
-                "calories_burned": data['calories_burned'],
-                "tips": data['tips'],
-                "log_time": int(datetime.now().timestamp() * 1000)
-            }
-
-        url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records"
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        payload = {"fields": fields}
-
-        resp = requests.post(url, headers=headers, json=payload).json()
-        if resp.get("code") == 0:
-            return True
+            fields_list = [{
+                "exercise_name": d['exercise_name'],
+                "duration": d['duration'],
+                "calories_burned": d['calories_burned'],
+                "tips": d['tips'],
+                "log_time": log_time
+            } for d in records]
+
+        # 只入队不等待，真正的写入由后台线程批量完成 (失败会落盘重放)
+        if len(fields_list) > 1:
+            get_feishu_writer().enqueue_many(table_id, fields_list)
         else:
-            st.error(f"❌ 飞书报错: {resp}")
-            return False
+            get_feishu_writer().enqueue(table_id, fields_list[0])
+        return True
     except Exception as e:
         st.error(f"❌ 飞书连接失败: {e}")
         return False
 
+# 双写调度：TiDB 限时写入，飞书只是入队；TiDB 失败 / 超时会记入待对账文件，后台定期补写
+def reconcile_tidb(entry, state):
+    rows = entry["data"] if isinstance(entry["data"], list) else [entry["data"]]
+    if not entry.get("log_time"):
+        return False  # 老格式的记录没有 log_time，没法判断写没写过，留给人工处理
+    if state == "unknown":
+        # 超时不代表失败：先看这批行是不是已经落库了，只补缺的
+        present = existing_log_names(get_db_pool(), entry["kind"], entry["log_time"])
+        rows = [r for r in rows if r[NAME_COLUMNS[entry["kind"]]] not in present]
+    return not rows or save_to_db(entry["kind"], rows, entry["log_time"])
+
+
+@st.cache_resource
+def get_dual_writer():
+    writer = DualWriter()
+    # 启动时对账一次，之后每 10 分钟补一次写失败 / 超时的 TiDB 记录，不用等重启
+    writer.start_reconciler({"tidb": reconcile_tidb})
+    return writer
+
+
+def dual_write(table_name, type_key, data):
+    ctx = get_script_run_ctx()  # 子线程里也要能调用 st.error
+    log_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return get_dual_writer().write(
+        {"tidb": lambda: save_to_db(table_name, data, log_time),
+         "feishu": lambda: save_to_feishu(type_key, data)},
+        kind=table_name, data=data,
+        thread_initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+        inline=("feishu",), log_time=log_time,
+    )
+
+
 # ---5. 数据读取函数---
-def load_from_db(table_name):
+def load_from_db(table_name, since=None):
     # 增加容错，防止读取失败导致页面崩溃
+    # 按块读、列类型固定 (Int32 / datetime64 / category)，不用再 to_datetime
     try:
-        conn = get_db_connection()
-        query = f"SELECT * FROM {table_name}"
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+        return load_log_frame(get_db_pool(), table_name, since)
     except Exception as e:
         st.error(f"读取数据失败: {e}")
         return pd.DataFrame()
 
+
+# 看板聚合缓存：进程级共享，启动时顺便确保 log_time 有索引
+@st.cache_resource
+def get_daily_totals_cache():
+    pool = get_db_pool()
+    try:
+        ensure_log_time_indexes(pool)
+    except Exception:
+        pass  # 没有建索引权限也不影响查询，只是慢一点
+    return DailyTotalsCache(pool)
+
+
+def load_today_totals():
+    # 今日摄入/消耗，SQL 里直接求和，不再把整张表拉回来
+    try:
+        return get_daily_totals_cache().get()
+    except Exception as e:
+        st.error(f"读取数据失败: {e}")
+        return {"diet_log": 0, "exercise_log": 0}
+
+
+# 历史趋势：按需加载最近 N 天的明细 (列类型固定，按天汇总不用再转换)，5 分钟内重复查看直接用缓存
+HISTORY_RANGES = [7, 30, 90, 365]
+
+
+@st.cache_data(ttl=300, max_entries=len(HISTORY_RANGES))
+def load_history(days):
+    since = history_start(days)
+    return load_from_db("diet_log", since), load_from_db("exercise_log", since)
+
+
+def render_history():
+    days = st.selectbox("时间范围", HISTORY_RANGES, index=1, format_func=lambda d: f"近 {d} 天")
+    diet, exercise = load_history(days)
+    if diet.empty and exercise.empty:
+        st.info("这段时间还没有记录")
+        return
+    # 汇总逻辑在 health_frames 里，两个 app 共用
+    st.line_chart(daily_trend(diet, exercise))
+    if not diet.empty:
+        st.bar_chart(top_foods(diet), horizontal=True)
+        st.dataframe(diet.sort_values("log_time", ascending=False), hide_index=True, use_container_width=True)
+
 # --- 6. 功能模块 A：健康管理 (原来的代码打包) ---
 def render_health_hub():
     st.header("🧬 AI 健康中枢")
@@ -205,20 +346,27 @@ def render_health_hub():
                 st.warning("请输入内容")
             else:
                 with st.spinner('AI 正在计算卡路里...'):
-                    result = get_food_info(food_input)
-                    # 确保 result 不是 None 再继续
-                    if result:
-                        st.info(f"🇺🇸 Advice: {result['tips']}")
+                    # 一句话里有多样食物：一次请求拿回全部条目；单样食物走原来的流程
+                    if is_multi_item(food_input):
+                        items = get_meal_items(food_input)
+                    else:
+                        result = get_food_info(food_input)
+                        items = [result] if result else []
+                    # 确保有结果再继续
+                    if items:
+                        if len(items) > 1:
+                            st.dataframe(pd.DataFrame(items), hide_index=True, use_container_width=True)
+                        else:
+                            st.info(f"🇺🇸 Advice: {items[0]['tips']}")
 
                         col1, col2 = st.columns(2)
 
-                        # 1. 写 TiDB (使用正确的表名)
-                        if save_to_db("diet_log", result):
-                            col1.success(f"SQL 写入成功: {result['food_name']}")
-
-                        # 2. 写 飞书 (使用小写 key)
-                        if save_to_feishu("diet", result):
-                            col2.success("飞书同步成功!")
+                        # 写 TiDB + 飞书入队 (多条时 executemany + 一个 batch_create)
+                        res = dual_write("diet_log", "diet", items)
+                        if res["tidb"].ok:
+                            col1.success(f"SQL 写入成功: {'、'.join(i['food_name'] for i in items)}")
+                        if res["feishu"].ok:
+                            col2.success("已加入飞书同步队列")
 
     with tab2:
         st.subheader("今天练了什么？")
@@ -235,31 +383,18 @@ def render_health_hub():
                         col1, col2 = st.columns(2)
 
                         # 修正了参数传反的问题，删除了错误的 csv 调用
-                        if save_to_db("exercise_log", result):
+                        res = dual_write("exercise_log", "exercise", result)
+                        if res["tidb"].ok:
                             col1.success(f"SQL 写入成功! (-{result['calories_burned']} kcal)")
-
-                        if save_to_feishu("exercise", result):
-                            col2.success("飞书同步成功!")
+                        if res["feishu"].ok:
+                            col2.success("已加入飞书同步队列")
 
     with tab3:
         st.subheader("📊 实时云端数据")
-        # 加载数据
-        df_diet = load_from_db("diet_log")
-        df_ex = load_from_db("exercise_log")
-
-        if not df_diet.empty:
-            df_diet['log_time'] = pd.to_datetime(df_diet['log_time'])
-            today_str = datetime.now().strftime("%Y-%m-%d")
-            today_cals = df_diet[df_diet['log_time'].dt.strftime("%Y-%m-%d") == today_str]['calories'].sum()
-        else:
-            today_cals = 0
-
-        if not df_ex.empty:
-            df_ex['log_time'] = pd.to_datetime(df_ex['log_time'])
-            today_str = datetime.now().strftime("%Y-%m-%d")
-            today_burn = df_ex[df_ex['log_time'].dt.strftime("%Y-%m-%d") == today_str]['calories_burned'].sum()
-        else:
-            today_burn = 0
+        # 加载数据 (按天聚合，日志再多也只查今天的索引范围)
+        totals = load_today_totals()
+        today_cals = totals["diet_log"]
+        today_burn = totals["exercise_log"]
 
         col1, col2, col3 = st.columns(3)
         net_calories = today_cals - today_burn
@@ -280,24 +415,91 @@ def render_health_hub():
         else:
             st.success("🟢 状态良好，继续保持！")
 
+        # 历史明细只在打开开关时才从 TiDB 读
+        if st.toggle("📈 显示历史趋势与明细"):
+            render_history()
+
 # --- 4. 功能模块 B：文献阅读 (新开发的科室) ---
-# 【优化1】加上缓存装饰器：只要文件没变，就不需要重新解析 PDF
-@st.cache_data
-def extract_text_from_pdf(uploaded_file):
-    """助手函数：把 PDF 文件变成字符串"""
-    uploaded_file.seek(0)
-    pdf_reader = PyPDF2.PdfReader(uploaded_file)
-    text = ""
-    # 遍历每一页读取文字
-    for i, page in enumerate(pdf_reader.pages):
-        page_content = page.extract_text()
-        if page_content:
-            # 【优化2】我们在每一页内容前加上 [第x页] 的标记
-            # 这样 AI 就能知道这段话来自哪里
-            text += f"\n\n--- [第 {i + 1} 页] ---\n\n"
-            text += page_content
-
-    return text
+# 【优化1】解析结果按 PDF 内容的 SHA-256 缓存到磁盘：只要文件没变，重启之后也不需要重新解析 PDF
+# 解析后端可在 secrets.toml 里用 pdf_backend 切换 (pypdf2 / pypdf / pymupdf)
+@st.cache_resource
+def get_pdf_cache():
+    return PdfTextCache(backend=st.secrets.get("pdf_backend", "pypdf2"))
+
+
+def pdf_progress_callback():
+    """边解析边显示进度、已估算的 Token 和首页预览 (只有第一次解析时才会出现)"""
+    progress = st.empty()
+    preview = st.empty()
+
+    def on_page(page_no, total, pages, tokens):
+        if len(pages) == 1:
+            preview.caption(pages[0][1][:PREVIEW_CHARS])
+        progress.progress(page_no / total, text=progress_text(page_no, total, tokens))
+
+    def done():
+        progress.empty()
+        preview.empty()
+
+    return on_page, done
+
+
+def extract_pdf(uploaded_file):
+    """助手函数：把 PDF 文件变成字符串，返回 {"sha256", "text", "tokens", "pages"}"""
+    # 【优化2】每一页内容前都带 [第x页] 的标记 (见 pdf_cache.join_pages)
+    # 这样 AI 就能知道这段话来自哪里
+    on_page, done = pdf_progress_callback()
+    entry = get_pdf_cache().extract(uploaded_file.getvalue(), on_page=on_page)
+    done()
+    return entry
+
+
+# 论文全文超出上下文预算时的退路：按问题检索相关片段 (索引按 PDF 的 SHA-256 存盘，只建一次)
+@st.cache_resource(max_entries=20)
+def get_paper_index(pdf_sha, _paper_text):
+    # 下划线开头的参数不参与缓存 key 的哈希，只用 PDF 的 SHA-256 做 key
+    return get_or_build_index(_paper_text, key=pdf_sha)
+
+
+# 前缀缓存命中统计：每次问答后按论文把命中 / 未命中 Token 记到 TiDB 的 llm_usage 表
+@st.cache_resource
+def get_usage_pool():
+    pool = get_db_pool()
+    ensure_usage_table(pool)
+    return pool
+
+
+def record_reader_usage(pdf_sha, paper_name, usage):
+    try:
+        record_usage(get_usage_pool(), "app_pdf_plus", pdf_sha, paper_name, usage)
+    except Exception:
+        pass  # 统计失败不影响问答
+
+
+@st.cache_data(ttl=60)
+def load_usage_stats(days=30):
+    return load_usage(get_usage_pool(), days)
+
+
+def render_prompt_cache_stats():
+    # 侧边栏：近 30 天的前缀缓存命中率和省下的钱，看缓存到底有没有生效 (数字由 usage_stats 统一算)
+    try:
+        daily, papers = load_usage_stats()
+    except Exception:
+        st.caption("📊 缓存统计未就绪")
+        return
+    if not daily:
+        st.caption("📊 暂无前缀缓存记录")
+        return
+    summary = summarize_usage(daily, papers, dict(DEFAULT_PRICES, **st.secrets.get("deepseek_prices", {})))
+    st.markdown("#### 📊 前缀缓存 (近 30 天)")
+    c1, c2 = st.columns(2)
+    c1.metric("命中率", f"{summary['hit_rate']:.0%}" if summary["hit_rate"] is not None else "-")
+    c2.metric("已节省", f"${summary['saved']:.3f}")
+    st.line_chart(pd.Series(summary["daily_rate"]), height=120)
+    with st.expander("按论文查看"):
+        st.dataframe(pd.DataFrame(summary["papers"]), hide_index=True)
+
 
 def render_med_reader():
     st.header("📄 AI 文献阅读助手")
@@ -310,9 +512,10 @@ def render_med_reader():
     if uploaded_file:
         # 解析文件 (有缓存，第二次会很快)
         with st.spinner("正在读取论文内容..."):
-            paper_text = extract_text_from_pdf(uploaded_file)
-            # --- 【新增】计算并显示 Token ---
-            tokens = count_tokens(paper_text)
+            pdf = extract_pdf(uploaded_file)
+            paper_text = pdf["text"]
+            # --- 【新增】显示 Token (提取时已按页算好并缓存，rerun 不用重算) ---
+            tokens = pdf["tokens"]
             char_count = len(paper_text)
             # 显示字符数统计
             st.success("读取成功！")
@@ -336,6 +539,11 @@ def render_med_reader():
             st.session_state.chat_history = []  # 清空记忆
             st.session_state.last_file = uploaded_file.name  # 更新文件名记录
             st.toast("检测到新文件，聊天记录已重置")
+        # 整个请求 (系统指令 + 论文 + 聊天记录) 的 Token 预算：论文部分来自缓存，聊天记录只给新消息计数
+        # 超出预算时较早的对话会被压缩成摘要，预算可在 secrets.toml 里用 chat_context_budget 调整
+        if "context_budget" not in st.session_state:
+            st.session_state.context_budget = ContextBudget(st.secrets.get("chat_context_budget", DEFAULT_BUDGET))
+        system_tokens = tokens + fulltext_overhead_tokens()
         # 4. 显示历史聊天记录 (回放记忆)
         # 每次页面刷新，都要把之前的聊天气泡重新画一遍
         for message in st.session_state.chat_history:
@@ -352,66 +560,68 @@ def render_med_reader():
             st.session_state.chat_history.append({"role": "user", "content": query})
 
             # B. 构造发给 AI 的完整消息列表
-            # 关键点：System Prompt (含论文) + History (旧记录) + Query (新问题)
+            # 关键点：System Prompt (含论文) + 早期对话摘要 + 最近几轮 (含新问题)
 
             # (1) 系统级指令：永远放在第一条，包含论文全文
-            # 💡 DeepSeek 会自动缓存这一条，因为它是固定不变的“前缀”
-            messages_payload = [
-                {
-                    "role": "system",
-                    "content": f"""
-                    你是一个严谨的医学科研助手。
-                    1. 请基于我提供的【论文内容】回答问题。
-                    2. **必须引用原文**：在回答的关键观点后，请标注出处，例如 (见第 3 页)。
-                    3. 如果论文中没有相关信息，请直接回答“文中未提及”，不要编造。
-                    4. 保持回答的逻辑性，使用 Markdown 格式（如列表、粗体）。
-                    【论文全文】：
-                    {paper_text}"""
-                }
-            ]
+            # 💡 DeepSeek 会自动缓存这一条，因为它是固定不变的“前缀” (两个 app 共用 reader_prompts，字节完全一致)
+            # 论文全文本身就超出预算时，压缩聊天记录也放不下，这一轮改用检索到的相关片段
+            budget = st.session_state.context_budget
+            if budget.fits(system_tokens):
+                system_message = fulltext_system_message(paper_text)
+                turn_tokens = system_tokens
+            else:
+                st.toast("论文全文超出上下文预算，本轮改用检索模式")
+                index = get_paper_index(pdf["sha256"], paper_text)
+                system_message = rag_system_message(build_context(search_chat(index, st.session_state.chat_history)))
+                turn_tokens = count_tokens(system_message["content"])
 
             # (2) 追加历史记录 (让 AI 知道上下文)
-            # 我们把 session_state 里的记录加进去
-            # *注意：为了省钱，你可以只取最近的 4-6 轮对话，这里演示取全部
-            messages_payload.extend(st.session_state.chat_history)
+            # 超出预算时，较早的几轮会先被压缩成一段摘要，只保留最近几轮原文
+            folded = budget.start
+            with st.spinner("正在整理上下文..."):
+                messages_payload, payload_tokens = budget.build(
+                    system_message, turn_tokens, st.session_state.chat_history, client)
+            if budget.start > folded:
+                st.toast(f"对话较长，已把前 {budget.start} 条记录压缩成摘要")
+            if payload_tokens > CONTEXT_LIMIT:
+                st.warning(f"⚠️ 本次请求约 {payload_tokens:,} Token，超过 DeepSeek 64k 上下文上限，可能会被截断或报错。")
 
             # C. 调用 API
             with st.chat_message("assistant"):
-                with st.spinner("AI 正在思考..."):
-                    try:
-                        response = client.chat.completions.create(
-                            model="deepseek-chat",
-                            messages=messages_payload, # 发送完整对话链
-                            temperature=0.1
-                        )
-
-                        answer = response.choices[0].message.content
-                        st.markdown(answer)
-
-                        # D. 把 AI 的回答也存入记忆
-                        st.session_state.chat_history.append({"role": "assistant", "content": answer})
-
-                        # E. 费用统计 (看看缓存有没有生效)
-                        if response.usage:
-                            prompt_tokens = response.usage.prompt_tokens  # 提问消耗 (PDF + 问题)
-                            completion_tokens = response.usage.completion_tokens  # 回答消耗 (AI 写的字)
-                            # 缓存命中的 Token 数量 (Cache Hit)
-                            cached_tokens = response.usage.prompt_cache_hit_tokens
-                            # 实际扣费的 Token 数量 (Cache Miss)
-                            miss_tokens = response.usage.prompt_cache_miss_tokens
-                            total = response.usage.total_tokens
-
-                            st.caption(f"""
-                            💰 **DeepSeek 缓存统计**:
-                            - 📥 阅读 (Input): `{prompt_tokens}` Tokens
-                            - ✅ 命中缓存: `{cached_tokens}` Tokens 
-                            - 🆕 新增读取: `{miss_tokens}` Tokens 
-                            - 📤 思考 (Output): `{completion_tokens}` Tokens
-                            - 💰 总计 (Total): `{total}` Tokens
-                            """)
-
-                    except Exception as e:
-                        st.error(f"出错: {e}")
+                try:
+                    with st.spinner("AI 正在思考..."):
+                        chat = create_chat_stream(client, messages_payload)  # 发送完整对话链
+
+                    # 流式输出：第一个字到了就开始显示，不用等整段回答
+                    answer = st.write_stream(chat)
+
+                    # D. 把 AI 的回答也存入记忆
+                    st.session_state.chat_history.append({"role": "assistant", "content": answer})
+
+                    # E. 费用统计 (看看缓存有没有生效)
+                    if chat.usage:
+                        prompt_tokens = chat.usage.prompt_tokens  # 提问消耗 (PDF + 问题)
+                        completion_tokens = chat.usage.completion_tokens  # 回答消耗 (AI 写的字)
+                        # 缓存命中的 Token 数量 (Cache Hit)
+                        cached_tokens = chat.usage.prompt_cache_hit_tokens
+                        # 实际扣费的 Token 数量 (Cache Miss)
+                        miss_tokens = chat.usage.prompt_cache_miss_tokens
+                        total = chat.usage.total_tokens
+
+                        st.caption(f"""
+                        💰 **DeepSeek 缓存统计**:
+                        - ⚡ 首字延迟: `{chat.first_token_latency or 0:.2f}` 秒 (总耗时 `{chat.total_latency or 0:.2f}` 秒)
+                        - 📥 阅读 (Input): `{prompt_tokens}` Tokens
+                        - ✅ 命中缓存: `{cached_tokens}` Tokens 
+                        - 🆕 新增读取: `{miss_tokens}` Tokens 
+                        - 📤 思考 (Output): `{completion_tokens}` Tokens
+                        - 💰 总计 (Total): `{total}` Tokens
+                        - 📏 上下文预算: 本轮发送约 `{payload_tokens}` / `{budget.budget}` Tokens (已压缩 `{budget.start}` 条早期对话)
+                        """)
+                        record_reader_usage(pdf["sha256"], uploaded_file.name, chat.usage)
+
+                except Exception as e:
+                    st.error(f"出错: {e}")
 
 
 # --- 5. 主程序入口 (总控室) ---
@@ -426,6 +636,12 @@ def main():
         )
         st.divider()
         st.caption("Dr. AI v2.0")
+        render_pool_stats()
+        render_llm_gateway_stats()
+        render_feishu_stats()
+        render_llm_cache_stats()
+        if choice == "文献阅读部":
+            render_prompt_cache_stats()
 
     # 根据选择渲染不同页面
     if choice == "健康管理部":
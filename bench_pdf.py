@@ -0,0 +1,45 @@
+"""PDF 提取速度基准：对每个已安装的后端分别跑串行 / 并行，输出 pages/sec
+
+用法: python bench_pdf.py paper.pdf [--workers 4] [--repeat 3]
+"""
+import argparse
+import time
+
+from pdf_extract import available_backends, iter_pages
+
+
+def run(data, backend, workers, parallel):
+    start = time.perf_counter()
+    pages = 0
+    chars = 0
+    # parallel_threshold 设成 0 / 无穷大，强制走并行 / 串行
+    threshold = 0 if parallel else float("inf")
+    for _, content, _ in iter_pages(data, backend, workers=workers, parallel_threshold=threshold):
+        pages += 1
+        chars += len(content)
+    return pages, chars, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 提取后端基准测试")
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        data = f.read()
+
+    print(f"{'backend':<10} {'mode':<10} {'pages':>6} {'chars':>10} {'best s':>8} {'pages/s':>9}")
+    for backend in available_backends():
+        for parallel in (False, True):
+            if parallel:
+                run(data, backend, args.workers, True)  # 预热进程池，不计时
+            results = [run(data, backend, args.workers, parallel) for _ in range(args.repeat)]
+            pages, chars, best = min(results, key=lambda r: r[2])
+            mode = f"parallel{args.workers}" if parallel else "serial"
+            print(f"{backend:<10} {mode:<10} {pages:>6} {chars:>10} {best:>8.3f} {pages / best:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from token_utils import MESSAGE_OVERHEAD, REPLY_PRIMING, ChatTokenLedger, count_tokens
+
+# --- 对话上下文预算 ---
+# 论文的 system prompt 永远原样放在第一条 (DeepSeek 的前缀缓存靠它命中)；
+# 聊天记录超出预算时，把较早的几轮交给 AI 压缩成一段滚动摘要，接在论文后面发送，最近几轮保留原文
+# 一次折叠到预算的 LOW_WATER 以下，留出余量，后面几轮不会每轮都再多一次摘要调用
+# 论文本身就放不进预算时折叠也没用，不再调摘要，由页面改用检索片段 (RAG)
+
+DEFAULT_BUDGET = 48000  # 给回答留出余量，不顶满 64k
+KEEP_RECENT = 6  # 至少保留最近 6 条 (3 轮) 原文
+LOW_WATER = 0.65  # 折叠后压到预算的 65%
+
+SUMMARY_PROMPT = """下面是用户和医学科研助手围绕同一篇论文的早期对话。
+请把【已有摘要】和【新对话】合并成一段新的摘要，供后续对话参考：
+1. 保留用户关心的问题、助手给出的关键结论和引用的页码。
+2. 不要编造，不要重复论文原文，控制在 300 字以内。
+【已有摘要】：
+{summary}
+【新对话】：
+{turns}"""
+
+
+def summarize_turns(client, summary, turns):
+    """把旧摘要和要折叠的几轮对话合并成新摘要 (非流式，一次调用)"""
+    text = "\n".join(f"{'问' if m['role'] == 'user' else '答'}：{m['content']}" for m in turns)
+    response = client.create(
+        model="deepseek-chat",
+        messages=[{"role": "user", "content": SUMMARY_PROMPT.format(summary=summary or "(无)", turns=text)}],
+        temperature=0.1,
+    )
+    return response.choices[0].message.content.strip()
+
+
+class ContextBudget:
+    """为整条消息链 (论文 + 摘要 + 最近几轮) 维持一个 Token 预算，存在 st.session_state 里跨 rerun 复用"""
+
+    def __init__(self, budget=DEFAULT_BUDGET, keep_recent=KEEP_RECENT, low_water=LOW_WATER):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.low_water = low_water
+        self.ledger = ChatTokenLedger()
+        self._history_id = None
+        self.reset()
+
+    def reset(self):
+        self.summary = ""
+        self.start = 0  # history[:start] 已并入摘要
+        self._summary_tokens = 0
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"【之前对话的摘要】：\n{self.summary}"}
+
+    def payload_tokens(self, system_tokens, history, start=None):
+        start = self.start if start is None else start
+        return self.ledger.payload_tokens(system_tokens + self._summary_tokens, history, start)
+
+    def fits(self, system_tokens):
+        """论文 (system) 加上摘要是否还放得进预算；放不进时折叠聊天记录也没用"""
+        return system_tokens + self._summary_tokens + MESSAGE_OVERHEAD + REPLY_PRIMING < self.budget
+
+    def _fold_end(self, system_tokens, history):
+        """折叠到哪一条为止：剩下的第一条必须是用户的问题，至少保留 keep_recent 条，
+        在此前提下折叠最少的条数，使剩余部分压到 low_water 以下"""
+        target = self.budget * self.low_water
+        end = self.start
+        for i in range(self.start + 1, len(history) - self.keep_recent + 1):
+            if history[i]["role"] != "user":
+                continue
+            end = i
+            if self.payload_tokens(system_tokens, history, i) <= target:
+                break
+        return end
+
+    def build(self, system_message, system_tokens, history, client):
+        """返回 (发给 AI 的消息列表, 估算的 Token 数)，超预算时先压缩较早的对话"""
+        # 换了论文 (列表被替换) 或记录被清空，摘要作废
+        if id(history) != self._history_id or len(history) < self.start:
+            self._history_id = id(history)
+            self.reset()
+
+        tokens = self.payload_tokens(system_tokens, history)
+        if tokens > self.budget and self.fits(system_tokens):
+            end = self._fold_end(system_tokens, history)
+            if end > self.start:
+                try:
+                    self.summary = summarize_turns(client, self.summary, history[self.start:end])
+                    self._summary_tokens = count_tokens(self._summary_message()["content"]) + MESSAGE_OVERHEAD
+                except Exception:
+                    pass  # 摘要失败就只丢弃旧记录，至少保证不超预算
+                self.start = end
+                tokens = self.payload_tokens(system_tokens, history)
+
+        messages = [system_message]
+        if self.summary:
+            messages.append(self._summary_message())
+        messages.extend(history[self.start:])
+        return messages, tokens
@@ -0,0 +1,37 @@
+import time
+
+
+# --- 流式回答 ---
+# 包一层 OpenAI 的 stream：边收边吐文字给 st.write_stream，同时记下首字延迟和最后一块里的 usage
+class ChatStream:
+    def __init__(self, stream, start_time=None):
+        self._stream = stream
+        self._start = start_time or time.perf_counter()
+        self.usage = None
+        self.first_token_latency = None  # 秒 (Time To First Token)
+        self.total_latency = None
+
+    def __iter__(self):
+        for chunk in self._stream:
+            # 开了 include_usage 后，最后一块没有 choices，只带 usage
+            if chunk.usage:
+                self.usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if self.first_token_latency is None:
+                    self.first_token_latency = time.perf_counter() - self._start
+                yield chunk.choices[0].delta.content
+        self.total_latency = time.perf_counter() - self._start
+
+
+def create_chat_stream(client, messages, **kwargs):
+    """发起流式请求，返回可以直接交给 st.write_stream 的 ChatStream"""
+    start = time.perf_counter()
+    stream = client.create(
+        model="deepseek-chat",
+        messages=messages,
+        temperature=0.1,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs,
+    )
+    return ChatStream(stream, start)
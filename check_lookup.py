@@ -0,0 +1,33 @@
+"""本地营养 / 运动数据库自检：data/ 里每个名称、别名、拼音都要能查回它自己那一行
+
+用法: python check_lookup.py   (有查不回来的条目时退出码为 1)
+"""
+import sys
+
+from local_lookup import LocalLookup
+
+
+def keys_of(row):
+    return [row["name"], row["pinyin"]] + [a for a in row["aliases"].split("|") if a]
+
+
+def main():
+    lookup = LocalLookup.from_dir()
+    failures = []
+    # (表名, 记录, 查询函数, 输入模板)：运动必须带时长才会查本地库
+    cases = [("foods", row, lookup.lookup_food, "{}") for row in lookup.foods]
+    cases += [("exercises", row, lookup.lookup_exercise, "{} 30分钟") for row in lookup.exercises]
+    for table, row, find, template in cases:
+        for key in keys_of(row):
+            result = find(template.format(key))
+            name = result and (result.get("food_name") or result.get("exercise_name"))
+            if name != row["name"]:
+                failures.append(f"{table}: {template.format(key)!r} -> {name!r} (应为 {row['name']!r})")
+    for line in failures:
+        print(line)
+    print(f"{len(cases)} 条记录，{len(failures)} 个键查不回自己")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
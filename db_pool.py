@@ -0,0 +1,97 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from mysql.connector import errors, pooling
+
+
+# --- TiDB 连接池 (三个 app 共用) ---
+# 以前每次 save_to_db / load_from_db 都要重新握手一次 TLS，这里改成进程级复用
+class TiDBPool:
+    def __init__(self, host, port, user, password, database,
+                 pool_size=5, pool_name="tidb_pool", acquire_timeout=10, ping_interval=30):
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout  # 连接全被占用时最多等多久 (秒)
+        self.ping_interval = ping_interval  # 闲置超过这个秒数，取出时先 ping 一下
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=pool_size,
+            pool_reset_session=True,
+            host=host, port=port, user=user, password=password, database=database,
+        )
+        self._last_used = {}  # 连接对象 id -> 上次归还时间
+        self._lock = threading.Lock()
+        # 等待时间统计
+        self._acquire_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._reconnects = 0
+
+    def get_connection(self):
+        """从池里借一个连接，用完调用 conn.close() 即归还"""
+        start = time.perf_counter()
+        while True:
+            try:
+                conn = self._pool.get_connection()
+                break
+            except errors.PoolError:
+                # 池子满了：稍等再试，超时才报错
+                if time.perf_counter() - start > self.acquire_timeout:
+                    raise
+                time.sleep(0.05)
+        waited = time.perf_counter() - start
+
+        self._health_check(conn)
+
+        with self._lock:
+            self._acquire_count += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def _health_check(self, conn):
+        # 闲置太久的连接可能已经被 TiDB Cloud 断开，先 ping，断了就重连
+        key = id(conn._cnx)
+        last = self._last_used.get(key, 0)
+        if time.time() - last > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except errors.Error:
+                conn.ping(reconnect=True, attempts=3, delay=1)
+                with self._lock:
+                    self._reconnects += 1
+        self._last_used[key] = time.time()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... 出错也保证归还"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            n = self._acquire_count
+            return {
+                "pool_size": self.pool_size,
+                "acquired": n,
+                "avg_wait_ms": round(self._wait_total / n * 1000, 2) if n else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+                "reconnects": self._reconnects,
+            }
+
+
+def create_pool(tidb_secrets):
+    """根据 secrets.toml 里的 [tidb] 配置建池，pool_size 等可选项不配就用默认值"""
+    return TiDBPool(
+        host=tidb_secrets["host"],
+        port=tidb_secrets["port"],
+        user=tidb_secrets["user"],
+        password=tidb_secrets["password"],
+        database=tidb_secrets["database"],
+        pool_size=int(tidb_secrets.get("pool_size", 5)),
+        acquire_timeout=float(tidb_secrets.get("pool_timeout", 10)),
+        ping_interval=float(tidb_secrets.get("pool_ping_interval", 30)),
+    )
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from datetime import datetime
+
+
+# --- TiDB + 飞书 双写调度 ---
+# 慢的落点 (TiDB) 放到线程池里限时执行；只是入队的落点 (飞书写入队列) 直接在当前线程调用，省掉一次线程切换
+# 超时的落点不算「失败」而是「未知」：线程还在跑，多半最后也写进去了，对账时要先查有没有再补写
+# 只入队的落点失败不记待对账 (飞书写入队列自己有 spool 重放)；对账在后台线程里定期跑，不用等重启
+@dataclass
+class SinkResult:
+    ok: bool
+    elapsed: float  # 秒
+    error: str = ""
+    unknown: bool = False  # 超时：不知道最后有没有写成功
+
+    @property
+    def state(self):
+        return "ok" if self.ok else "unknown" if self.unknown else "failed"
+
+
+class DualWriter:
+    def __init__(self, max_workers=4, timeout=10.0, reconcile_path="pending_reconcile.jsonl"):
+        self.timeout = timeout
+        self.reconcile_path = reconcile_path
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dual-write")
+        self._lock = threading.Lock()
+
+    def write(self, sinks, kind, data, thread_initializer=None, inline=(), log_time=None):
+        """sinks: {名称: 无参函数}，函数返回真值表示写入成功。返回 {名称: SinkResult}
+        inline 里的落点在当前线程直接调用；log_time 会记进待对账记录，对账时用来查这批行是否已经写入"""
+
+        def run(fn):
+            if thread_initializer:
+                thread_initializer()  # 例如给线程挂上 Streamlit 的 ScriptRunContext
+            start = time.perf_counter()
+            ok = bool(fn())
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        futures = {name: self._executor.submit(run, fn) for name, fn in sinks.items() if name not in inline}
+        results = {}
+        for name in inline:
+            sink_start = time.perf_counter()
+            try:
+                ok = bool(sinks[name]())
+                results[name] = SinkResult(ok, time.perf_counter() - sink_start, "" if ok else "写入失败")
+            except Exception as e:
+                results[name] = SinkResult(False, time.perf_counter() - sink_start, str(e))
+        for name, future in futures.items():
+            # 所有落点共用一个截止时间
+            remaining = max(0.0, self.timeout - (time.perf_counter() - start))
+            try:
+                ok, elapsed = future.result(timeout=remaining)
+                results[name] = SinkResult(ok, elapsed, "" if ok else "写入失败")
+            except FutureTimeout:
+                results[name] = SinkResult(False, self.timeout, "超时", unknown=True)
+            except Exception as e:
+                results[name] = SinkResult(False, time.perf_counter() - start, str(e))
+
+        failed = [name for name, r in results.items() if not r.ok and name not in inline]
+        if failed:
+            self._record_pending(kind, data, {name: r for name, r in results.items() if name not in inline},
+                                 log_time)
+        return results
+
+    def _record_pending(self, kind, data, results, log_time):
+        """有一边失败 / 超时时记一笔待对账记录，方便之后补写"""
+        entry = {
+            "kind": kind,
+            "data": data,
+            "log_time": log_time,
+            "results": {name: {"ok": r.ok, "state": r.state, "error": r.error} for name, r in results.items()},
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            with open(self.reconcile_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def reconcile(self, handlers):
+        """补写待对账记录。handlers: {名称: fn(entry, state)}，state 是 "failed" 或 "unknown"
+        (unknown 时 fn 应先查目标里是否已经有这批数据，避免重复插入)，返回真值表示已补齐
+        补齐的落点标记为 ok；没有 handler 的落点没法补，不再保留。返回补齐的落点数"""
+        # 整个过程持锁：对账期间新的待对账记录会等它写完文件再追加，不会被覆盖掉
+        with self._lock:
+            if not os.path.exists(self.reconcile_path):
+                return 0
+            with open(self.reconcile_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            fixed = 0
+            remaining = []
+            for entry in entries:
+                for name, result in entry["results"].items():
+                    state = result.get("state") or ("ok" if result["ok"] else "failed")
+                    if state == "ok" or name not in handlers:
+                        continue
+                    try:
+                        done = handlers[name](entry, state)
+                    except Exception:
+                        done = False
+                    if done:
+                        result.update(ok=True, state="ok", error="")
+                        fixed += 1
+                if not all(r["ok"] for name, r in entry["results"].items() if name in handlers):
+                    remaining.append(entry)
+            tmp = self.reconcile_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            os.replace(tmp, self.reconcile_path)
+        return fixed
+
+    def start_reconciler(self, handlers, interval=600.0):
+        """后台线程：立刻对账一次，之后每隔 interval 秒再对一次 (没有待对账文件时什么都不做)"""
+
+        def loop():
+            while True:
+                try:
+                    self.reconcile(handlers)
+                except Exception:
+                    pass  # TiDB 还没恢复，下一轮再试
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name="dual-write-reconcile", daemon=True)
+        thread.start()
+        return thread
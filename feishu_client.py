@@ -0,0 +1,59 @@
+import threading
+import time
+
+import requests
+
+# --- 飞书开放平台客户端 (三个 app 共用) ---
+FEISHU_BASE_URL = "https://open.feishu.cn/open-apis"
+
+# token 失效 / 过期 相关的错误码，遇到时刷新 token 重试一次
+AUTH_ERROR_CODES = {99991661, 99991663, 99991668}
+
+
+class FeishuClient:
+    def __init__(self, app_id, app_secret, refresh_margin=300, timeout=10):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin  # 距离过期还剩多少秒就提前刷新
+        self.timeout = timeout
+        self._token = None
+        self._expire_at = 0.0
+        self._lock = threading.Lock()
+        self._session = requests.Session()  # 复用 HTTPS 连接
+
+    def _fetch_token(self):
+        url = f"{FEISHU_BASE_URL}/auth/v3/tenant_access_token/internal"
+        req = {"app_id": self.app_id, "app_secret": self.app_secret}
+        resp = self._session.post(url, json=req, timeout=self.timeout).json()
+        token = resp.get("tenant_access_token")
+        if token:
+            self._token = token
+            # expire 单位是秒，一般是 7200 (两小时)
+            self._expire_at = time.time() + int(resp.get("expire", 7200))
+        return token
+
+    def get_token(self, force=False):
+        """获取 tenant_access_token：有缓存且没快过期就直接用，否则重新申请"""
+        with self._lock:
+            if not force and self._token and time.time() < self._expire_at - self.refresh_margin:
+                return self._token
+            return self._fetch_token()
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expire_at = 0.0
+
+    def post(self, path, payload):
+        """带鉴权的 POST，返回飞书的 JSON 响应；token 失效时自动刷新并重试一次"""
+        for attempt in range(2):
+            token = self.get_token(force=attempt > 0)
+            if not token:
+                return {"code": -1, "msg": "tenant_access_token 获取失败"}
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            resp = self._session.post(f"{FEISHU_BASE_URL}{path}", headers=headers, json=payload,
+                                      timeout=self.timeout).json()
+            if resp.get("code") not in AUTH_ERROR_CODES:
+                return resp
+            self.invalidate()
+        return resp
@@ -0,0 +1,159 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# --- 飞书写入队列 (write-behind) ---
+# 按钮回调里只负责把记录放进队列，后台线程攒够一批 (或等够时间) 再用 batch_create 一次写入
+# 限流 / 网络错误这类临时失败的批次落盘到 spool 文件，启动时和运行中 (按退避间隔) 自动重放
+# 字段错误、没权限这类永久失败重放也没用，记到 rejected 文件里留给人工处理，不再重发
+
+BATCH_CREATE_LIMIT = 500  # 飞书 batch_create 单次最多 500 条
+RATE_LIMIT_CODES = {1254290}  # 请求过于频繁
+NETWORK_ERROR = -1  # 请求没发出去 / 没收到响应
+MAX_REPLAY_INTERVAL = 3600  # 飞书一直不可用时，重放间隔最多退避到 1 小时
+
+
+class FeishuBatchWriter:
+    def __init__(self, client, app_token, batch_size=20, flush_interval=3.0,
+                 min_request_interval=0.2, max_retries=3, spool_path="feishu_spool.jsonl",
+                 rejected_path="feishu_rejected.jsonl", replay_interval=300):
+        self.client = client
+        self.app_token = app_token
+        self.batch_size = min(batch_size, BATCH_CREATE_LIMIT)
+        self.flush_interval = flush_interval  # 最早一条记录最多等多久就发出去 (秒)
+        self.min_request_interval = min_request_interval  # 两次请求的最小间隔，避免触发限流
+        self.max_retries = max_retries
+        self.spool_path = spool_path
+        self.rejected_path = rejected_path
+        self.replay_interval = replay_interval  # 有失败批次时，隔多久 (秒) 重放一次；重放后仍失败则间隔翻倍
+        self._replay_delay = replay_interval
+        self._next_replay = time.time() + replay_interval
+
+        self._queues = {}  # table_id -> [fields, ...]
+        self._oldest = {}  # table_id -> 队列里最早一条的入队时间
+        self._cond = threading.Condition()
+        self._last_request = 0.0
+        self._spool_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self._spooled = 0  # 本进程落盘待重放的条数 (启动时的 spool 已经重放并删掉了)
+
+        self.replay_spool()
+        self._thread = threading.Thread(target=self._run, name="feishu-batch-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    # 1. 入队 (在 UI 线程调用，立即返回)
+    def enqueue(self, table_id, fields):
+        with self._cond:
+            queue = self._queues.setdefault(table_id, [])
+            if not queue:
+                self._oldest[table_id] = time.time()
+            queue.append(fields)
+            if len(queue) >= self.batch_size:
+                self._cond.notify()
+
+    def enqueue_many(self, table_id, fields_list):
+        """一餐多条记录一起入队并立即触发 flush，用一个 batch_create 请求写完"""
+        with self._cond:
+            self._queues.setdefault(table_id, []).extend(fields_list)
+            self._oldest[table_id] = 0.0  # 视为已超时，后台线程醒来就发
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    # 2. 后台线程：按数量或时间阈值触发 flush
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=0.5)
+                ready = self._take_ready(force=False)
+            for table_id, records in ready:
+                self._send(table_id, records)
+            # 飞书故障期间落盘的批次，不等重启，按退避间隔放回队列再试
+            if self.spooled() and time.time() >= self._next_replay:
+                self.replay_spool()
+                self._next_replay = time.time() + self._replay_delay
+                self._replay_delay = min(self._replay_delay * 2, MAX_REPLAY_INTERVAL)
+
+    def _take_ready(self, force):
+        ready = []
+        now = time.time()
+        for table_id, queue in self._queues.items():
+            if not queue:
+                continue
+            if force or len(queue) >= self.batch_size or now - self._oldest[table_id] >= self.flush_interval:
+                while queue:
+                    ready.append((table_id, queue[:self.batch_size]))
+                    del queue[:self.batch_size]
+        return ready
+
+    def flush(self):
+        """立刻把队列里所有记录发出去 (进程退出时也会调用)"""
+        with self._cond:
+            ready = self._take_ready(force=True)
+        for table_id, records in ready:
+            self._send(table_id, records)
+
+    # 3. 发送一批：遇到限流 / 网络错误就退避重试，重试完还失败才落盘
+    def _send(self, table_id, records):
+        path = f"/bitable/v1/apps/{self.app_token}/tables/{table_id}/records/batch_create"
+        payload = {"records": [{"fields": f} for f in records]}
+        for attempt in range(self.max_retries):
+            wait = self.min_request_interval - (time.time() - self._last_request)
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.time()
+            try:
+                resp = self.client.post(path, payload)
+            except Exception as e:
+                resp = {"code": NETWORK_ERROR, "msg": str(e)}
+            if resp.get("code") == 0:
+                self.sent += len(records)
+                self._replay_delay = self.replay_interval  # 飞书恢复了，重放间隔回到初始值
+                return True
+            if resp.get("code") not in RATE_LIMIT_CODES and resp.get("code") != NETWORK_ERROR:
+                # 字段错误、没权限之类的问题，重试 / 重放都没用
+                self.rejected += len(records)
+                self._append(self.rejected_path, table_id, records, resp)
+                return False
+            if attempt < self.max_retries - 1:
+                time.sleep(2 ** attempt)
+        self.failed += len(records)
+        self._append(self.spool_path, table_id, records, resp)
+        with self._spool_lock:
+            self._spooled += len(records)
+        return False
+
+    # 4. spool / rejected 文件：一行一个失败批次
+    def _append(self, path, table_id, records, resp):
+        with self._spool_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"table_id": table_id, "records": records, "error": resp},
+                                   ensure_ascii=False) + "\n")
+
+    def spooled(self):
+        # 侧边栏每次 rerun 都会调用，用内存计数，不去读文件
+        with self._spool_lock:
+            return self._spooled
+
+    def replay_spool(self):
+        """把 spool 里的失败批次重新放回队列"""
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return 0
+            with open(self.spool_path, encoding="utf-8") as f:
+                batches = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spool_path)
+            self._spooled = 0  # 文件里的都放回队列了；再失败会重新落盘计数
+        count = 0
+        for batch in batches:
+            for fields in batch["records"]:
+                self.enqueue(batch["table_id"], fields)
+                count += 1
+        return count
@@ -0,0 +1,118 @@
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# --- 日志明细加载 ---
+# 以前 load_from_db 是 pd.read_sql(原生 mysql.connector 连接)：走 pandas 的 DBAPI 兜底路径，
+# 所有列都是 object，日期还要再 to_datetime 一遍，多年的日志又慢又占内存
+# 这里按列定死类型：热量 / 营养素用 Int32，log_time 直接是 datetime64，食物 / 运动名用 category
+# (名字重复度很高，category 只存一份字符串 + 整数编码)；用非缓冲游标按块取，每块转好类型再拼起来
+
+# 每张表的列和类型 (白名单，表名不会拼接用户输入)
+# 整数列用可空的 Int32：老数据里可能有 NULL，普通 int32 放不下
+LOG_DTYPES = {
+    "diet_log": {
+        "food_name": "category",
+        "calories": "Int32",
+        "protein": "Int32",
+        "carbohydrate": "Int32",
+        "fat": "Int32",
+        "tips": "string",
+        "log_time": "datetime64[ns]",
+    },
+    "exercise_log": {
+        "exercise_name": "category",
+        "duration": "string",
+        "calories_burned": "Int32",
+        "tips": "string",
+        "log_time": "datetime64[ns]",
+    },
+}
+CHUNK_ROWS = 5000
+
+
+def string_dtype():
+    """装了 pyarrow 就用 Arrow 存字符串 (连续内存，不是一个个 Python 对象)，没装用 pandas 自带的 string"""
+    try:
+        import pyarrow  # noqa: F401
+        return "string[pyarrow]"
+    except ImportError:
+        return "string"
+
+
+def _typed_chunk(rows, dtypes, text_dtype):
+    columns = list(dtypes)
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for column, dtype in dtypes.items():
+        if dtype == "Int32":
+            # TiDB 里可能是 DECIMAL / 字符串，先转数字；非法值变成 <NA>
+            df[column] = pd.to_numeric(df[column], errors="coerce").round().astype("Int32")
+        elif dtype == "string":
+            df[column] = df[column].astype(text_dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def _concat(frames, dtypes, text_dtype):
+    if not frames:
+        return _typed_chunk([], dtypes, text_dtype)
+    categorical = [c for c, dtype in dtypes.items() if dtype == "category"]
+    # 每块的 category 词表不一样，直接 concat 会退化成 object；先把词表合并再拼
+    merged = {c: union_categoricals([f[c] for f in frames]) for c in categorical}
+    df = pd.concat([f.drop(columns=categorical) for f in frames], ignore_index=True)
+    for column in categorical:
+        df[column] = merged[column]
+    return df[list(dtypes)]
+
+
+def load_log_frame(pool, table, since=None, chunk_rows=CHUNK_ROWS):
+    """按块读出一张日志表，返回列类型固定的 DataFrame (按 log_time 升序)；since 只取该时间之后的记录"""
+    dtypes = LOG_DTYPES[table]
+    text_dtype = string_dtype()
+    sql = f"SELECT {', '.join(dtypes)} FROM {table}"
+    params = []
+    if since is not None:
+        sql += " WHERE log_time >= %s"
+        params.append(since)
+    sql += " ORDER BY log_time"
+
+    frames = []
+    with pool.connection() as conn:
+        # buffered=False：结果留在服务端，一块块拉回来，内存里同时只有一块 Python 元组
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            frames.append(_typed_chunk(rows, dtypes, text_dtype))
+        cursor.close()
+    return _concat(frames, dtypes, text_dtype)
+
+
+def history_start(days, today=None):
+    """最近 days 天 (含今天) 第一天的 00:00"""
+    today = today or date.today()
+    return datetime.combine(today - timedelta(days=days - 1), datetime.min.time())
+
+
+def daily_sum(df, column):
+    """按天汇总某一列；log_time 已经是 datetime64，直接 normalize 到零点分组"""
+    if df.empty:
+        return pd.Series(dtype="Int32")
+    return df.groupby(df["log_time"].dt.normalize())[column].sum()
+
+
+def daily_trend(diet, exercise):
+    """每天的摄入 / 消耗，两张表哪天没记录就补 0"""
+    return pd.DataFrame({"摄入": daily_sum(diet, "calories"),
+                         "消耗": daily_sum(exercise, "calories_burned")}).fillna(0)
+
+
+def top_foods(diet, n=10):
+    """这段时间热量贡献最多的食物；food_name 是 category，observed=True 只统计出现过的"""
+    if diet.empty:
+        return pd.Series(dtype="Int32")
+    return diet.groupby("food_name", observed=True)["calories"].sum().nlargest(n)
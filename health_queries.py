@@ -0,0 +1,83 @@
+import threading
+from datetime import date, datetime, timedelta
+
+# --- 看板查询层 ---
+# 以前看板要 SELECT * 整张表再在 pandas 里按日期筛选，日志一多就越来越慢
+# 这里把「按天过滤 + 求和」下推到 SQL，走 log_time 索引的范围查询
+
+# 每张表要累加的热量字段 (白名单，表名不会拼接用户输入)
+SUM_COLUMNS = {
+    "diet_log": "calories",
+    "exercise_log": "calories_burned",
+}
+# 每张表里标识一条记录的名称字段 (对账时和 log_time 一起判断是否已经写入)
+NAME_COLUMNS = {
+    "diet_log": "food_name",
+    "exercise_log": "exercise_name",
+}
+
+
+def day_bounds(day):
+    """返回 [当天 00:00, 次日 00:00) 的时间范围，用于可走索引的范围查询"""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def ensure_log_time_indexes(pool):
+    """给 log_time 建索引 (已存在则跳过)，只需在进程启动时执行一次"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        for table in SUM_COLUMNS:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_log_time ON {table} (log_time)")
+        conn.commit()
+        cursor.close()
+
+
+def query_daily_totals(pool, day):
+    """一次往返同时查出某天的摄入和消耗总量"""
+    start, end = day_bounds(day)
+    parts = []
+    params = []
+    for table, column in SUM_COLUMNS.items():
+        parts.append(f"(SELECT COALESCE(SUM({column}), 0) FROM {table} WHERE log_time >= %s AND log_time < %s)")
+        params.extend([start, end])
+    sql = "SELECT " + ", ".join(parts)
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        cursor.close()
+    return {table: int(value or 0) for table, value in zip(SUM_COLUMNS, row)}
+
+
+def existing_log_names(pool, table, log_time):
+    """某次写入 (同一个 log_time) 里已经落库的名称，用来对账时只补写缺的行"""
+    column = NAME_COLUMNS[table]
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {column} FROM {table} WHERE log_time = %s", (log_time,))
+        names = {name for name, in cursor.fetchall()}
+        cursor.close()
+    return names
+
+
+class DailyTotalsCache:
+    """按天缓存聚合结果：历史日期的数据不会再变，查一次就永久缓存；只有今天每次都重新查"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, day=None):
+        day = day or date.today()
+        if day < date.today():
+            with self._lock:
+                if day in self._cache:
+                    return self._cache[day]
+        totals = query_daily_totals(self.pool, day)
+        if day < date.today():
+            with self._lock:
+                self._cache[day] = totals
+        return totals
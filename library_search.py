@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+
+from paper_rag import INDEX_DIR, split_pages, tokenize
+
+# --- 全库检索 ---
+# 用 SQLite FTS5 给 paper_library 里所有 PDF (按页) 和 paper_notes 的问答 / 摘要建一个本地全文索引
+# 中英文统一用 paper_rag.tokenize 切词 (英文按词、中文按相邻两字) 后写入 terms 列，排序用 FTS5 自带的 bm25
+# 新存 PDF、新归档笔记时增量写入；同一篇 PDF 按内容 SHA-256 去重，只索引一次
+
+DB_PATH = os.path.join(INDEX_DIR, "library.sqlite3")
+NOTE_BATCH = 200  # 补索引时每次从 TiDB 取多少条笔记
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_key TEXT PRIMARY KEY,  -- pdf:<sha256> 或 note:<id>
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    ref TEXT,  -- PDF 的本地路径 / 笔记 id
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    terms,
+    doc_key UNINDEXED,
+    page UNINDEXED,
+    body UNINDEXED
+);
+"""
+
+
+def match_query(text):
+    """把用户的问题变成 FTS5 的 OR 查询；每个词加引号，避免被当成 FTS5 语法"""
+    terms = dict.fromkeys(tokenize(text))  # 去重保持顺序
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def make_snippet(body, query, width=160):
+    """截取第一个命中词附近的一段文字，命中词加粗"""
+    lower = body.lower()
+    positions = [(lower.find(t), t) for t in tokenize(query)]
+    positions = [(pos, t) for pos, t in positions if pos >= 0]
+    if not positions:
+        return body[:width].replace("\n", " ")
+    pos, term = min(positions)
+    start = max(0, pos - width // 3)
+    end = min(len(body), start + width)
+    snippet = (body[start:pos] + "**" + body[pos:pos + len(term)] + "**" + body[pos + len(term):end])
+    return ("…" if start else "") + snippet.replace("\n", " ") + ("…" if end < len(body) else "")
+
+
+class LibrarySearch:
+    def __init__(self, path=DB_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 后台同步线程和页面线程共用一个连接，用锁串行化
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def has(self, doc_key):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM docs WHERE doc_key = ?", (doc_key,)).fetchone() is not None
+
+    def _replace(self, doc_key, kind, title, ref, passages):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM passages WHERE doc_key = ?", (doc_key,))
+            self._conn.executemany(
+                "INSERT INTO passages (terms, doc_key, page, body) VALUES (?, ?, ?, ?)",
+                [(" ".join(tokenize(body)), doc_key, page, body) for page, body in passages if body.strip()])
+            self._conn.execute("INSERT OR REPLACE INTO docs (doc_key, kind, title, ref, indexed_at) "
+                               "VALUES (?, ?, ?, ?, ?)", (doc_key, kind, title, ref, time.time()))
+
+    def index_pdf(self, sha, title, path, paper_text):
+        """paper_text 是带 [第 N 页] 标记的全文 (pdf_cache 的结果)；已经索引过的 PDF 直接跳过"""
+        doc_key = f"pdf:{sha}"
+        if self.has(doc_key):
+            return False
+        self._replace(doc_key, "pdf", title, path, split_pages(paper_text))
+        return True
+
+    def index_note(self, note):
+        """笔记的问题、回答、摘要作为一段；摘要生成后再调一次会覆盖旧的"""
+        body = "\n".join(str(note.get(k) or "") for k in ("summary", "question", "answer"))
+        self._replace(f"note:{note['id']}", "note", note.get("paper_name") or "笔记", str(note["id"]), [(None, body)])
+
+    def indexed_note_ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT ref FROM docs WHERE kind = 'note'").fetchall()
+        return {int(ref) for ref, in rows}
+
+    def search(self, query, k=10, kind=None):
+        """返回 [{"kind", "title", "ref", "page", "snippet", "body", "score"}, ...]，按相关度排序"""
+        match = match_query(query)
+        if not match:
+            return []
+        sql = ("SELECT d.kind, d.title, d.ref, p.page, p.body, bm25(passages) AS score "
+               "FROM passages p JOIN docs d ON d.doc_key = p.doc_key WHERE passages MATCH ?")
+        params = [match]
+        if kind:
+            sql += " AND d.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"kind": kind_, "title": title, "ref": ref, "page": page, "body": body,
+                 "snippet": make_snippet(body, query), "score": -score}
+                for kind_, title, ref, page, body, score in rows]
+
+    def stats(self):
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT kind, COUNT(*) FROM docs GROUP BY kind").fetchall())
+            passages = self._conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {"pdfs": rows.get("pdf", 0), "notes": rows.get("note", 0), "passages": passages}
+
+
+def build_library_context(hits, body_chars=1200):
+    """把全库检索结果拼成给 AI 的参考资料，每段标明来源论文和页码"""
+    parts = []
+    for hit in hits:
+        source = f"《{hit['title']}》第 {hit['page']} 页" if hit["kind"] == "pdf" else f"笔记《{hit['title']}》"
+        parts.append(f"【{source}】\n{hit['body'][:body_chars]}")
+    return "\n\n".join(parts)
+
+
+def sync_library(search, pool=None, pdf_cache=None, store=None):
+    """补齐索引：书架 (paper_store) 上还没索引的 PDF、TiDB 里还没索引的笔记。在后台线程里跑，首次可能要一会儿"""
+    if pdf_cache is not None and store is not None:
+        for sha, path, name in store.items():
+            if search.has(f"pdf:{sha}"):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    entry = pdf_cache.extract(f.read())
+            except Exception:
+                continue  # 损坏 / 加密的 PDF 跳过，不影响其他文件
+            search.index_pdf(sha, name, path, entry["text"])
+    if pool is not None:
+        # 和已索引的 id 全集做差，而不是只看最大 id：乱序写入 / 上次同步失败漏掉的笔记也能补上
+        indexed = search.indexed_note_ids()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM paper_notes")
+            missing = sorted(note_id for note_id, in cursor.fetchall() if note_id not in indexed)
+            cursor.close()
+        for i in range(0, len(missing), NOTE_BATCH):
+            batch = missing[i:i + NOTE_BATCH]
+            with pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("SELECT id, paper_name, question, answer, summary FROM paper_notes "
+                               f"WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+                rows = cursor.fetchall()
+                cursor.close()
+            for row in rows:
+                search.index_note(row)
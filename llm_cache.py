@@ -0,0 +1,109 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# --- AI 结果缓存 (食物 / 运动) ---
+# 用户经常重复记录同样的东西 (「一碗米饭」「慢跑30分钟」)，同样的输入直接复用上次的结果，不再调 API
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_NUM_RE = re.compile(r"[零一二两三四五六七八九十百]+")
+# 常见单位写法统一
+_UNIT_ALIASES = [
+    (re.compile(r"(\d+)\s*(?:分钟|minutes?|mins?)"), r"\1min"),
+    (re.compile(r"(\d+)\s*个半小时"), lambda m: f"{int(m.group(1)) * 60 + 30}min"),
+    (re.compile(r"(\d+)\s*(?:个?小时|hours?|hrs?|h(?![a-z]))"), r"\1h"),
+    (re.compile(r"(\d+)\s*(?:公里|km)"), r"\1km"),
+    (re.compile(r"(\d+)\s*(?:克|g(?![a-z]))"), r"\1g"),
+    (re.compile(r"半小时"), "30min"),
+]
+_PUNCT_RE = re.compile(r"[\s，。、,.!！?？~～:：;；\"'“”‘’()（）]+")
+
+
+def cn_to_int(text):
+    """把「三十」「两百五十」这类中文数字转成整数"""
+    total, current = 0, 0
+    for ch in text:
+        if ch == "百":
+            total += (current or 1) * 100
+            current = 0
+        elif ch == "十":
+            total += (current or 1) * 10
+            current = 0
+        else:
+            current = _CN_DIGITS[ch]
+    return total + current
+
+
+def normalize_text(text, quantity_aware=True):
+    """缓存 key：全半角统一、小写、去标点空白；quantity_aware 时再把数量和单位统一写法"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _PUNCT_RE.sub("", text)
+    if quantity_aware:
+        text = _CN_NUM_RE.sub(lambda m: str(cn_to_int(m.group())), text)
+        for pattern, repl in _UNIT_ALIASES:
+            text = pattern.sub(repl, text)
+    return text
+
+
+class LLMCache:
+    def __init__(self, path="llm_cache.sqlite3", ttl_days=30, max_entries=5000, quantity_aware=True):
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.quantity_aware = quantity_aware
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " kind TEXT, cache_key TEXT, value TEXT, created_at REAL, last_access REAL,"
+            " PRIMARY KEY (kind, cache_key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, kind, text):
+        key = normalize_text(text, self.quantity_aware)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE kind = ? AND cache_key = ?", (kind, key)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE kind = ? AND cache_key = ?", (now, kind, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, kind, text, value):
+        key = normalize_text(text, self.quantity_aware)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (kind, cache_key, value, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            # 过期的直接删；超出容量时按最近访问时间淘汰 (LRU)
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE rowid IN ("
+                " SELECT rowid FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+        }
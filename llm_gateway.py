@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import openai
+
+# --- LLM 网关 ---
+# 所有 DeepSeek 调用都走这里：进程内共用一个 AsyncClient 和一个后台事件循环
+# 每次调用有超时；429 / 5xx / 网络错误按指数退避重试；同时在途的请求数有上限；
+# 多个会话同时发出一模一样的请求 (非流式) 时，只真正调用一次，结果大家共用
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_DONE = object()
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS
+
+
+def request_key(kwargs):
+    """同样的参数 (模型、消息、温度...) 得到同样的 key，用于合并在途请求"""
+    raw = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    def __init__(self, api_key, base_url, max_concurrency=8, timeout=30.0, stream_timeout=120.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        self.timeout = timeout  # 非流式调用的单次超时 (秒)
+        self.stream_timeout = stream_timeout  # 流式调用两块之间最长等待
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # SDK 自带的重试关掉，统一由这里的退避策略负责
+        self._client = openai.AsyncClient(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}  # 请求 key -> Task，只在事件循环线程里读写，不用加锁
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=500)  # 最近 500 次成功调用的耗时，算 p50 / p95
+        self._counts = {"calls": 0, "errors": 0, "retries": 0, "coalesced": 0}
+
+    # 同步入口：Streamlit 的脚本线程调用，参数和 client.chat.completions.create 一样
+    def create(self, **kwargs):
+        """stream=True 时返回逐块 yield 的迭代器，否则返回完整的 ChatCompletion"""
+        if kwargs.get("stream"):
+            return self._iter_stream(kwargs)
+        return asyncio.run_coroutine_threadsafe(self._coalesced_call(kwargs), self._loop).result()
+
+    async def _coalesced_call(self, kwargs):
+        key = request_key(kwargs)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._call(kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._bump("coalesced")
+        # shield：某个等待者超时 / 取消时，不影响其他会话还在等的同一个请求
+        return await asyncio.shield(task)
+
+    async def _call(self, kwargs, limit=True):
+        kwargs = dict(kwargs)
+        kwargs.setdefault("timeout", self.stream_timeout if kwargs.get("stream") else self.timeout)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                if limit:
+                    async with self._semaphore:
+                        result = await self._client.chat.completions.create(**kwargs)
+                else:
+                    result = await self._client.chat.completions.create(**kwargs)
+                self._record(time.perf_counter() - start)
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._record(None)
+                    raise
+                self._bump("retries")
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def _backoff(self, attempt, error):
+        # 429 带了 Retry-After 就按它等，否则指数退避 + 随机抖动，避免多个会话同时重试
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _iter_stream(self, kwargs):
+        """立刻发出请求并等到第一块 (或错误)，再返回逐块 yield 的迭代器：
+        调用方的 spinner 罩住的是真正的等待，连接 / 鉴权错误也在这里直接抛出"""
+        # 事件循环里收流，通过队列一块块交给脚本线程；流式回答因人而异，不做合并
+        chunks = queue.Queue()
+
+        async def pump():
+            stream = None
+            try:
+                # 整个流式回答期间都占着一个并发名额
+                async with self._semaphore:
+                    stream = await self._call(kwargs, limit=False)
+                    async for chunk in stream:
+                        chunks.put(chunk)
+                chunks.put(_DONE)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                if stream is not None:
+                    await stream.close()  # 取消 / 出错时也要把 HTTP 连接还回去
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            first = self._next_chunk(chunks)
+        except BaseException:
+            future.cancel()
+            raise
+        return self._drain(first, chunks, future)
+
+    def _next_chunk(self, chunks):
+        try:
+            item = chunks.get(timeout=self.stream_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"流式回答超过 {self.stream_timeout:.0f} 秒没有新内容")
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def _drain(self, item, chunks, future):
+        try:
+            while item is not _DONE:
+                yield item
+                item = self._next_chunk(chunks)
+        finally:
+            future.cancel()  # 用户中途离开 / 出错时，停止后台收流
+
+    def _bump(self, name):
+        with self._stats_lock:
+            self._counts[name] += 1
+
+    def _record(self, elapsed):
+        with self._stats_lock:
+            self._counts["calls"] += 1
+            if elapsed is None:
+                self._counts["errors"] += 1
+            else:
+                self._latencies.append(elapsed)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000) if latencies else 0
+
+        return {
+            **counts,
+            "error_rate": counts["errors"] / counts["calls"] if counts["calls"] else 0.0,
+            "in_flight": len(self._inflight),
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+        }
+
+
+def create_gateway(api_key, options=None):
+    """options 来自 secrets.toml 的 [llm_gateway] 段 (可选)"""
+    options = dict(options or {})
+    return LLMGateway(
+        api_key=api_key,
+        base_url=options.pop("base_url", "https://api.deepseek.com/v1"),
+        **options,
+    )
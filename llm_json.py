@@ -0,0 +1,98 @@
+import json
+import re
+from dataclasses import MISSING, asdict, dataclass, fields
+
+# --- AI 结构化输出 ---
+# 请求时打开 DeepSeek 的 response_format=json_object，不用再剥 ```json 围栏
+# 返回内容按下面的类型校验，数字字段统一转成 int (兼容 "350"、"350 kcal"、350.6 这种写法)
+# 校验不通过时把错误告诉 AI，只修一次；修完还不行才报错
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+REPAIR_PROMPT = "上一条回复不符合要求：{error}。请只返回修正后的 JSON 对象，字段和格式按最开始的要求。"
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def coerce_int(value, name):
+    if isinstance(value, bool):
+        raise SchemaError(f"{name} 应该是整数")
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        match = _NUMBER_RE.search(str(value or ""))
+        if not match:
+            raise SchemaError(f"{name} 应该是整数，收到的是 {value!r}")
+        number = float(match.group())
+    if number < 0:
+        raise SchemaError(f"{name} 不能是负数")
+    return int(round(number))
+
+
+def build(cls, data):
+    """按 dataclass 的字段类型校验并转换一个 dict；没有默认值的字段不能缺，有默认值的缺了就用默认值"""
+    if not isinstance(data, dict):
+        raise SchemaError("应该返回一个 JSON 对象")
+    values = {}
+    for field in fields(cls):
+        raw = data.get(field.name)
+        if raw is None and field.default is not MISSING:
+            values[field.name] = field.default
+        elif field.type is int:
+            values[field.name] = coerce_int(raw, field.name)
+        else:
+            text = "" if raw is None else str(raw).strip()
+            if not text and field.default is MISSING:
+                raise SchemaError(f"缺少 {field.name}")
+            values[field.name] = text
+    return cls(**values)
+
+
+@dataclass(slots=True, frozen=True)
+class FoodInfo:
+    food_name: str
+    calories: int
+    protein: int
+    carbohydrate: int = 0  # AI 偶尔漏掉这两项，按 0 记，不为此多花一次修复调用
+    fat: int = 0
+    tips: str = ""
+
+
+@dataclass(slots=True, frozen=True)
+class ExerciseInfo:
+    exercise_name: str
+    duration: str
+    calories_burned: int
+    tips: str = ""
+
+
+def parse_object(cls, content):
+    """解析单个对象，返回校验后的 dict (字段齐全、数字都是 int，可以直接交给 save_to_db)"""
+    return asdict(build(cls, json.loads(content)))
+
+
+def ask_json(client, system_prompt, user_input, parse):
+    """以 JSON 模式调用 AI，用 parse(content) 校验；失败时带着错误原因让 AI 修一次"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input},
+    ]
+    content = _complete(client, messages)
+    try:
+        return parse(content)
+    except ValueError as e:  # json.JSONDecodeError 和 SchemaError 都是 ValueError
+        messages.append({"role": "assistant", "content": content})
+        messages.append({"role": "user", "content": REPAIR_PROMPT.format(error=e)})
+        return parse(_complete(client, messages))
+
+
+def _complete(client, messages):
+    response = client.create(
+        model="deepseek-chat",
+        messages=messages,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    )
+    return response.choices[0].message.content
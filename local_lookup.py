@@ -0,0 +1,165 @@
+import csv
+import difflib
+import os
+import re
+import unicodedata
+
+from llm_cache import cn_to_int
+from meal_parser import is_multi_item
+
+# --- 本地营养 / 运动数据库 ---
+# 常见食物和运动直接查表计算，毫秒都不到；查不到或把握不大时才交给 DeepSeek
+# 返回的 JSON 字段和 AI 提示词里定义的完全一致，save_to_db / save_to_feishu 不用改
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+_NUM = r"(\d+(?:\.\d+)?|[零一二两三四五六七八九十百]+|半)"
+_FOOD_UNITS = r"(千克|kg|克|g|毫升|ml|碗|个|杯|份|片|根|块|只|盘|瓶|听|罐|串|勺)"
+# 阿拉伯数字后面可以不跟单位 (「2 鸡蛋」)；中文数字必须跟着单位才算数量，不然「三文鱼」的「三」也会被当成 3 份
+_FOOD_QTY_RE = re.compile(r"(\d+(?:\.\d+)?)\s*" + _FOOD_UNITS + r"?|([零一二两三四五六七八九十百]+|半)\s*" + _FOOD_UNITS)
+_DURATION_RE = re.compile(_NUM + r"\s*(个半小时|个小时|小时|hours?|hrs?|h(?![a-z])|分钟|minutes?|mins?)")
+
+# 口语里常见的修饰词，匹配前去掉
+_FILLER_RE = re.compile(r"今天|早上|中午|晚上|早餐|午餐|晚餐|早饭|午饭|晚饭|夜宵|大概|左右|吃了|喝了|练了|做了|我|吃|喝|打|踢|了|去")
+_SPACE_PUNCT_RE = re.compile(r"[\s。!！?？~～:：\"'“”‘’()（）]+")
+
+_GRAM_UNITS = {"克": 1, "g": 1, "毫升": 1, "ml": 1, "千克": 1000, "kg": 1000}
+
+
+def _to_number(token):
+    if token == "半":
+        return 0.5
+    if re.fullmatch(r"\d+(?:\.\d+)?", token):
+        return float(token)
+    return float(cn_to_int(token))
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFKC", text).lower().strip()
+
+
+def _core_text(text):
+    """去掉时长、数量单位和口语修饰词，只留下食物 / 运动本身"""
+    text = _normalize(text)
+    text = _DURATION_RE.sub("", text)
+    text = _FOOD_QTY_RE.sub("", text)
+    text = _FILLER_RE.sub("", text)
+    return _SPACE_PUNCT_RE.sub("", text)
+
+
+def parse_duration_minutes(text):
+    """「30分钟」「30 minutes」「一个半小时」「半小时」 -> 分钟数，解析不到返回 None"""
+    m = _DURATION_RE.search(_normalize(text))
+    if not m:
+        return None
+    value, unit = _to_number(m.group(1)), m.group(2)
+    if unit == "个半小时":
+        return (value + 0.5) * 60
+    if unit.startswith(("分", "min")):
+        return value
+    return value * 60
+
+
+def parse_food_grams(text, unit, unit_grams):
+    """按数量和单位折算成克数；没写数量就按 1 份算"""
+    m = _FOOD_QTY_RE.search(_normalize(text))
+    if not m:
+        return unit_grams
+    qty, qty_unit = _to_number(m.group(1) or m.group(3)), m.group(2) or m.group(4)
+    if qty_unit in _GRAM_UNITS:
+        return qty * _GRAM_UNITS[qty_unit]
+    # 碗 / 个 / 份 这类计数单位统一按该食物的「一份」折算
+    return qty * unit_grams
+
+
+class LocalLookup:
+    def __init__(self, foods, exercises, min_confidence=0.8):
+        self.min_confidence = min_confidence
+        self.foods = foods
+        self.exercises = exercises
+        # 索引：名称 / 别名 / 拼音 -> 记录，按长度倒序方便做最长匹配
+        self._food_index = self._build_index(foods)
+        self._exercise_index = self._build_index(exercises)
+
+    @classmethod
+    def from_dir(cls, data_dir=DATA_DIR, **kwargs):
+        def read(name):
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                return list(csv.DictReader(f))
+
+        return cls(read("foods.csv"), read("exercises.csv"), **kwargs)
+
+    @staticmethod
+    def _build_index(rows):
+        index = {}
+        for row in rows:
+            keys = [row["name"], row["pinyin"]] + [a for a in row["aliases"].split("|") if a]
+            for key in keys:
+                # 和输入走同一套清洗 (去空格、标点、修饰词)，「table tennis」这种多词别名才能匹配上
+                key = _core_text(key)
+                if key:
+                    index.setdefault(key, row)
+        return dict(sorted(index.items(), key=lambda kv: -len(kv[0])))
+
+    def _match(self, text, index):
+        """返回 (记录, 置信度)。先做子串最长匹配，没有再做模糊匹配"""
+        core = _core_text(text)
+        if not core:
+            return None, 0.0
+        hits = []
+        matched_len = 0
+        remaining = core
+        for key, row in index.items():
+            if key in remaining:
+                if all(row is not h for h in hits):
+                    hits.append(row)
+                matched_len += len(key) * remaining.count(key)
+                remaining = remaining.replace(key, " ")
+        if len(hits) > 1:
+            return None, 0.0  # 一句话里有多样东西，交给 AI 处理
+        if len(hits) == 1:
+            # 匹配到的字占整句的比例：「鱼香肉丝」只命中「鱼」，置信度很低
+            return hits[0], matched_len / len(core)
+
+        # 完全没有子串命中：做模糊匹配 (输错字、写法不同的情况)
+        best, best_score = None, 0.0
+        for key, row in index.items():
+            score = difflib.SequenceMatcher(None, core, key).ratio()
+            if score > best_score:
+                best, best_score = row, score
+        return best, best_score
+
+    def lookup_food(self, text):
+        if is_multi_item(text):
+            return None
+        row, confidence = self._match(text, self._food_index)
+        if row is None or confidence < self.min_confidence:
+            return None
+        grams = parse_food_grams(text, row["unit"], float(row["unit_grams"]))
+        ratio = grams / 100
+        return {
+            "food_name": row["name"],
+            "calories": int(round(float(row["calories"]) * ratio)),
+            "protein": int(round(float(row["protein"]) * ratio)),
+            "carbohydrate": int(round(float(row["carbohydrate"]) * ratio)),
+            "fat": int(round(float(row["fat"]) * ratio)),
+            "tips": row["tips"],
+        }
+
+    def lookup_exercise(self, text, weight_kg=60):
+        if is_multi_item(text):
+            return None
+        minutes = parse_duration_minutes(text)
+        if not minutes:
+            return None  # 没说练了多久就算不准，交给 AI 估算
+        row, confidence = self._match(text, self._exercise_index)
+        if row is None or confidence < self.min_confidence:
+            return None
+        # 消耗 (kcal) = MET × 体重 (kg) × 时长 (小时)
+        burned = float(row["met"]) * weight_kg * minutes / 60
+        return {
+            "exercise_name": row["name"],
+            "duration": f"{int(round(minutes))} mins",
+            "calories_burned": int(round(burned)),
+            "tips": row["tips"],
+        }
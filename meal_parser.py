@@ -0,0 +1,56 @@
+import json
+import re
+from dataclasses import asdict
+
+from llm_json import FoodInfo, SchemaError, build
+
+# --- 一餐多样食物的批量解析 ---
+# 「米饭、红烧肉、青菜和一杯可乐」一次请求让 AI 返回数组，而不是拆成 N 次调用
+
+_SPLIT_RE = re.compile(r"[和、,，+＋;；]|还有|以及|加上")
+
+MEAL_PROMPT = """
+    You are a nutritionist. The user input may contain several foods eaten in one meal.
+    Split it into individual foods and return JSON in this format:
+    {
+        "items": [
+            {
+                "food_name": "Food name in Chinese",
+                "calories": integer (kcal),
+                "protein": integer (g),
+                "carbohydrate": integer (g),
+                "fat": integer (g),
+                "tips": "One short health advice in English"
+            }
+        ]
+    }
+    """
+
+
+def is_multi_item(text):
+    return bool(_SPLIT_RE.search(text))
+
+
+def split_items(text):
+    return [p.strip() for p in _SPLIT_RE.split(text) if p and p.strip()]
+
+
+def validate_food_item(item):
+    """按 FoodInfo 校验单条结果并把数字字段转成 int，不合格返回 None"""
+    try:
+        return asdict(build(FoodInfo, item))
+    except SchemaError:
+        return None
+
+
+def parse_meal_items(content):
+    """解析 AI 返回的 {"items": [...]}。返回 (有效条目, 无效条数)，一条有效的都没有时抛 SchemaError"""
+    data = json.loads(content)
+    raw = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(raw, list) or not raw:
+        raise SchemaError("应该返回 {\"items\": [...]}，且至少有一样食物")
+    items = [validate_food_item(x) for x in raw]
+    valid = [x for x in items if x]
+    if not valid:
+        raise SchemaError("items 里每一项都缺字段或数字格式不对")
+    return valid, len(items) - len(valid)
@@ -0,0 +1,145 @@
+import csv
+import json
+import os
+from datetime import datetime
+
+from note_tags import tag_filter_sql
+
+# --- 知识库导出 ---
+# 点了按钮才导出：用非缓冲 (服务端) 游标按块从 TiDB 取，边取边写文件，内存占用和表多大无关
+# 支持 CSV 和 Parquet (列式 + zstd 压缩，pyarrow 在 requirements.txt 里)，以及「只导出上次导出之后的新笔记」
+
+EXPORT_DIR = os.path.join("paper_library", ".exports")
+STATE_FILE = "last_export.json"  # 记录上次导出到的 (log_time, id)
+CHUNK_ROWS = 1000
+FORMATS = {"CSV": ".csv", "Parquet": ".parquet"}
+# 导出的列和 Parquet 类型 (固定写死：第一块里某列全是 NULL 也不会推断成 null 类型)
+EXPORT_COLUMNS = (
+    ("id", "int64"),
+    ("paper_name", "string"),
+    ("question", "string"),
+    ("answer", "string"),
+    ("tags", "string"),
+    ("file_path", "string"),
+    ("summary", "string"),
+    ("log_time", "timestamp"),
+)
+KEEP_FILES = 5  # 导出目录只留最近几个文件
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def load_watermark(export_dir=EXPORT_DIR):
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    return datetime.fromisoformat(state["log_time"]), state["id"]
+
+
+def save_watermark(mark, export_dir=EXPORT_DIR):
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"log_time": mark[0].isoformat(), "id": mark[1]}, f)
+    os.replace(path + ".tmp", path)
+
+
+def iter_note_chunks(pool, tags=None, since=None, chunk_rows=CHUNK_ROWS):
+    """按 (log_time, id) 升序逐块 yield (列名, 行列表)；since 是 (log_time, id)，只取它之后的"""
+    join, params = tag_filter_sql(tags)
+    where = ""
+    if since is not None:
+        where = " WHERE (n.log_time > %s OR (n.log_time = %s AND n.id > %s))"
+        params = params + [since[0], since[0], since[1]]
+    columns = ", ".join(f"n.{name}" for name, _ in EXPORT_COLUMNS)
+    sql = f"SELECT {columns} FROM paper_notes n{join}{where} ORDER BY n.log_time, n.id"
+    with pool.connection() as conn:
+        # buffered=False：结果留在服务端，fetchmany 一块块往回拉
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(sql, params)
+            columns = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield columns, rows
+        finally:
+            # 导出中途出错 / 被中断时，把没读完的结果读掉再还连接，不然池里的连接会卡在「有未读结果」
+            if conn.unread_result:
+                conn.consume_results()
+            cursor.close()
+
+
+def _write_csv(chunks, path):
+    count = 0
+    last = None
+    # utf-8-sig：Excel 打开中文不乱码
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        header_done = False
+        for columns, rows in chunks:
+            if not header_done:
+                writer.writerow(columns)
+                header_done = True
+            writer.writerows(rows)
+            count += len(rows)
+            last = dict(zip(columns, rows[-1]))
+    return count, last
+
+
+def _write_parquet(chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"int64": pa.int64(), "string": pa.string(), "timestamp": pa.timestamp("ms")}
+    schema = pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS])
+    count = 0
+    last = None
+    writer = None
+    try:
+        for columns, rows in chunks:
+            table = pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table)
+            count += len(rows)
+            last = dict(zip(columns, rows[-1]))
+    finally:
+        if writer is not None:
+            writer.close()
+    return count, last
+
+
+def export_notes(pool, fmt="CSV", tags=None, incremental=False, export_dir=EXPORT_DIR):
+    """导出到 export_dir 下的新文件，返回 (文件路径, 行数)；没有新数据时返回 (None, 0)"""
+    os.makedirs(export_dir, exist_ok=True)
+    _prune(export_dir)
+    since = load_watermark(export_dir) if incremental else None
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(export_dir, f"medical_notes-{stamp}{'-incr' if incremental else ''}{FORMATS[fmt]}")
+    chunks = iter_note_chunks(pool, tags, since)
+    count, last = (_write_parquet if fmt == "Parquet" else _write_csv)(chunks, path)
+    if not count:
+        if os.path.exists(path):
+            os.remove(path)
+        return None, 0
+    if not tags:
+        # 按标签筛选的导出不算一次「全量备份」，不推进水位
+        save_watermark((last["log_time"], last["id"]), export_dir)
+    return path, count
+
+
+def _prune(export_dir, keep=KEEP_FILES - 1):
+    files = sorted((os.path.join(export_dir, name) for name in os.listdir(export_dir)
+                    if name.startswith("medical_notes-")), key=os.path.getmtime)
+    for path in files[:max(0, len(files) - keep)]:
+        os.remove(path)
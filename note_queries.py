@@ -0,0 +1,47 @@
+from note_tags import tag_filter_sql
+
+# --- 知识库列表查询 ---
+# 列表只取 id / summary / tags / log_time 四列，按 (log_time, id) 做 keyset 分页：
+# 翻到第几页都是一次走索引的范围查询，不随笔记总数变慢；长长的 answer 只在点开某条时才单独查
+
+LIST_COLUMNS = ("id", "summary", "tags", "log_time")
+PAGE_SIZE = 50
+
+
+def ensure_note_indexes(pool):
+    """给 (log_time, id) 建索引 (已存在则跳过)，只需在进程启动时执行一次"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_paper_notes_log_time_id ON paper_notes (log_time, id)")
+        conn.commit()
+        cursor.close()
+
+
+def query_note_page(pool, tags=None, after=None, page_size=PAGE_SIZE):
+    """按时间倒序取一页。after 是上一页最后一条的 (log_time, id)，第一页传 None
+    返回 (这一页的行, 是否还有下一页)"""
+    join, params = tag_filter_sql(tags)
+    where = ""
+    if after is not None:
+        # 展开写，保证能用上 (log_time, id) 索引做范围扫描
+        where = " WHERE (n.log_time < %s OR (n.log_time = %s AND n.id < %s))"
+        params = params + [after[0], after[0], after[1]]
+    columns = ", ".join(f"n.{c}" for c in LIST_COLUMNS)
+    sql = (f"SELECT {columns} FROM paper_notes n{join}{where} "
+           f"ORDER BY n.log_time DESC, n.id DESC LIMIT %s")
+    with pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(sql, params + [page_size + 1])  # 多取一条，用来判断有没有下一页
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows[:page_size], len(rows) > page_size
+
+
+def query_note(pool, note_id):
+    """点开某条笔记时再取完整内容 (问题、回答、文件路径)"""
+    with pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM paper_notes WHERE id = %s", (note_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+
+from llm_json import SchemaError, ask_json
+
+# --- 笔记摘要后台生成 ---
+# 归档时先带占位摘要写入 TiDB，页面立即返回；后台线程攒几条待处理的笔记，一次 AI 调用生成全部摘要，
+# 再回写 paper_notes.summary，并通过 on_done 回调同步到飞书 (「精简摘要」字段)
+# 占位摘要本身就是待办标记：进程重启后 recover() 会把还没生成摘要的笔记重新捞出来
+
+PENDING_SUMMARY = "⏳ 摘要生成中"
+FAILED_SUMMARY = "摘要生成失败"
+ANSWER_CHARS = 1500  # 每条回答最多带多少字给 AI，够提炼结论就行
+
+BATCH_PROMPT = """你是一个严谨的医学科研助手。下面有若干组论文问答，每组都有编号。
+请为每一组生成一个20字以内的核心结论摘要，不要标点。
+返回 JSON：{"summaries": [{"id": 编号, "summary": "摘要"}]}"""
+
+
+def format_notes(notes):
+    return "\n\n".join(f"【编号 {n['id']}】\n问：{n['question']}\n答：{n['answer'][:ANSWER_CHARS]}" for n in notes)
+
+
+def parse_summaries(content):
+    """返回 {笔记 id: 摘要}"""
+    data = json.loads(content)
+    items = data.get("summaries") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise SchemaError("应该返回 {\"summaries\": [...]}")
+    result = {}
+    for item in items:
+        if isinstance(item, dict) and str(item.get("summary", "")).strip():
+            try:
+                result[int(item["id"])] = str(item["summary"]).strip()
+            except (KeyError, TypeError, ValueError):
+                continue
+    if not result:
+        raise SchemaError("summaries 里没有有效的摘要")
+    return result
+
+
+class NoteSummarizer:
+    def __init__(self, pool, client, on_done=None, batch_size=8, linger=1.0):
+        self.pool = pool
+        self.client = client
+        self.on_done = on_done  # on_done(note, summary)，摘要写回 TiDB 之后调用
+        self.batch_size = batch_size
+        self.linger = linger  # 来了第一条后再等多久，让同一时间归档的几条凑成一批 (秒)
+        self._pending = []
+        self._cond = threading.Condition()
+        self.done = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="note-summarizer", daemon=True)
+        self._thread.start()
+
+    def submit(self, note):
+        """note 至少要有 id / question / answer，其余字段原样交给 on_done"""
+        with self._cond:
+            self._pending.append(note)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def recover(self):
+        """把还带着占位摘要的笔记 (上次进程退出时没来得及处理的) 重新放回队列"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT id, paper_name, question, answer, tags, file_path FROM paper_notes WHERE summary = %s",
+                (PENDING_SUMMARY,))
+            rows = cursor.fetchall()
+            cursor.close()
+        for row in rows:
+            row["tags"] = [t for t in (row["tags"] or "").split(",") if t]
+            self.submit(row)
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.linger)
+            with self._cond:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            try:
+                self._process(batch)
+            except Exception:
+                # 回写 TiDB 失败：笔记仍是占位摘要，下次 recover() 会再处理
+                self.failed += len(batch)
+
+    def _process(self, batch):
+        try:
+            summaries = ask_json(self.client, BATCH_PROMPT, format_notes(batch), parse_summaries)
+        except Exception:
+            summaries = {}
+        results = [(note, summaries.get(int(note["id"]), FAILED_SUMMARY)) for note in batch]
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("UPDATE paper_notes SET summary = %s WHERE id = %s",
+                               [(summary, note["id"]) for note, summary in results])
+            conn.commit()
+            cursor.close()
+
+        for note, summary in results:
+            if summary == FAILED_SUMMARY:
+                self.failed += 1
+            else:
+                self.done += 1
+            if self.on_done:
+                self.on_done(note, summary)
@@ -0,0 +1,67 @@
+# --- 笔记标签索引 ---
+# paper_notes.tags 是逗号拼接的字符串，以前要 SELECT * 全表再在 pandas 里拆分、逐行匹配
+# 这里维护一张 (note_id, tag) 的倒排表：写笔记时同一个事务里写入，标签列表和按标签筛选都走索引
+
+TAG_MAX_LEN = 64
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id BIGINT NOT NULL,
+    tag VARCHAR(64) NOT NULL,
+    PRIMARY KEY (note_id, tag),
+    KEY idx_note_tags_tag (tag, note_id)
+)
+"""
+
+
+def split_tags(tags):
+    """列表或逗号拼接的字符串 -> 去空白、去重、保持顺序的标签列表"""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    seen = []
+    for tag in tags or []:
+        tag = str(tag).strip()[:TAG_MAX_LEN]
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def add_note_tags(cursor, note_id, tags):
+    """在写 paper_notes 的同一个连接 / 事务里调用，保证两张表一致"""
+    rows = [(note_id, tag) for tag in split_tags(tags)]
+    if rows:
+        cursor.executemany("INSERT IGNORE INTO note_tags (note_id, tag) VALUES (%s, %s)", rows)
+
+
+def ensure_tag_table(pool):
+    """建表；表是空的就从 paper_notes.tags 回填一次 (只读 id 和 tags 两列)。只需在进程启动时执行一次"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TABLE_SQL)
+        cursor.execute("SELECT 1 FROM note_tags LIMIT 1")
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT id, tags FROM paper_notes WHERE tags IS NOT NULL AND tags <> ''")
+            for note_id, tags in cursor.fetchall():
+                add_note_tags(cursor, note_id, tags)
+        conn.commit()
+        cursor.close()
+
+
+def query_tag_counts(pool):
+    """[(标签, 笔记数), ...]，按使用次数从多到少"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT tag, COUNT(*) AS n FROM note_tags GROUP BY tag ORDER BY n DESC, tag")
+        rows = cursor.fetchall()
+        cursor.close()
+    return [(tag, int(n)) for tag, n in rows]
+
+
+def tag_filter_sql(tags):
+    """按标签筛选笔记的 JOIN 子句和参数 (带任意一个标签即命中)，没有标签时返回空"""
+    tags = split_tags(tags)
+    if not tags:
+        return "", []
+    placeholders = ", ".join(["%s"] * len(tags))
+    return (f" JOIN (SELECT DISTINCT note_id FROM note_tags WHERE tag IN ({placeholders})) t ON t.note_id = n.id",
+            tags)
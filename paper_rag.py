@@ -0,0 +1,121 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+
+# --- 文献检索 (RAG) ---
+# 不再把整篇论文塞进 system prompt：按页切块建 BM25 索引，每次只把最相关的几块 (带页码) 发给 AI
+# 索引按论文内容的哈希存到 paper_library/.index/ 下，同一篇论文只建一次
+
+INDEX_DIR = os.path.join("paper_library", ".index")
+RAG_TOP_K = 6  # 每次问答发给 AI 的片段数
+PAGE_MARKER_RE = re.compile(r"\n*--- \[第 (\d+) 页\] ---\n*")
+_LATIN_RE = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def split_pages(paper_text):
+    """按 extract_text_from_pdf 加的 [第 N 页] 标记拆成 [(页码, 内容), ...]"""
+    parts = PAGE_MARKER_RE.split(paper_text)
+    # split 之后是 [标记前的内容, 页码, 内容, 页码, 内容, ...]
+    return [(int(parts[i]), parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2) if parts[i + 1].strip()]
+
+
+def chunk_pages(pages, chunk_chars=1200, overlap=200):
+    """页内切块，块不会跨页，这样每块都能准确标注出处页码"""
+    chunks = []
+    step = max(1, chunk_chars - overlap)
+    for page, text in pages:
+        for start in range(0, max(len(text) - overlap, 1), step):
+            piece = text[start:start + chunk_chars].strip()
+            if piece:
+                chunks.append({"page": page, "text": piece})
+    return chunks
+
+
+def tokenize(text):
+    """英文按词切，中文按相邻两字切 (不依赖分词库)"""
+    text = text.lower()
+    tokens = _LATIN_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, chunks, postings, doc_len, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.postings = postings  # 词 -> [[块编号, 词频], ...]
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.avg_len = sum(doc_len) / len(doc_len) if doc_len else 0.0
+
+    @classmethod
+    def build(cls, chunks):
+        postings = {}
+        doc_len = []
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append([doc_id, tf])
+        return cls(chunks, postings, doc_len)
+
+    def search(self, query, k=5):
+        n = len(self.chunks)
+        scores = Counter()
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / (self.avg_len or 1))
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return [(score, self.chunks[doc_id]) for doc_id, score in scores.most_common(k)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "postings": self.postings, "doc_len": self.doc_len},
+                      f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["chunks"], data["postings"], data["doc_len"])
+
+
+def text_key(paper_text):
+    return hashlib.sha256(paper_text.encode("utf-8")).hexdigest()
+
+
+def get_or_build_index(paper_text, key=None, index_dir=INDEX_DIR):
+    """有持久化的索引就直接读，没有就切块建索引并写盘"""
+    key = key or text_key(paper_text)
+    path = os.path.join(index_dir, f"{key}.bm25.json")
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    index = BM25Index.build(chunk_pages(split_pages(paper_text)))
+    index.save(path)
+    return index
+
+
+def search_chat(index, history, k=RAG_TOP_K):
+    """按聊天记录检索：追问时带上上一个问题一起搜，避免「那它的样本量呢」这种问题搜不到"""
+    questions = [m["content"] for m in history if m["role"] == "user"][-2:]
+    return index.search(" ".join(questions), k=k)
+
+
+def build_context(hits):
+    """把检索到的片段按页码排好，拼成给 AI 的参考资料"""
+    hits = sorted(hits, key=lambda h: h[1]["page"])
+    return "\n\n".join(f"【第 {chunk['page']} 页】\n{chunk['text']}" for _, chunk in hits)
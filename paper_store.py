@@ -0,0 +1,136 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# --- 书架 (内容寻址存储) ---
+# PDF 按内容的 SHA-256 存到 paper_library/objects/<前两位>/<sha256>.pdf：
+# 同一篇论文换个文件名上传只存一份 (提取缓存、检索索引也都按 SHA-256 共用)，不同论文同名也不会互相覆盖
+# 文件名 -> SHA-256 的别名记在 paper_library/manifest.json 里
+
+LIBRARY_DIR = "paper_library"
+CHUNK_SIZE = 1024 * 1024  # 分块读写，每块 1MB
+
+
+def file_sha256(fileobj):
+    """分块读文件对象算 SHA-256，不把整个文件读进内存"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PaperStore:
+    def __init__(self, root=LIBRARY_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._manifest = self._load_manifest()  # sha -> {"names": [...], "size": 字节数, "added_at": 时间戳}
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def path(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], f"{sha}.pdf")
+
+    def save(self, fileobj, name, sha=None):
+        """先边读边算哈希 (不落盘)，书架上还没有这份内容时才写文件。返回 (sha256, 路径, 是否新文件)
+        调用方已经算过哈希时可以直接传 sha 进来，省掉一遍读取"""
+        if sha is None:
+            sha = file_sha256(fileobj)
+        path = self.path(sha)
+        is_new = False
+        if not os.path.exists(path):
+            # 写到临时文件再改名，写到一半中断也不会留下半个对象
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = os.path.join(self.objects_dir, f".upload-{uuid.uuid4().hex}.tmp")
+            fileobj.seek(0)
+            with open(tmp, "wb") as f:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    f.write(chunk)
+            with self._lock:
+                is_new = not os.path.exists(path)
+                if is_new:
+                    os.replace(tmp, path)
+                else:
+                    os.remove(tmp)  # 另一个会话刚好存了同样的内容
+        self._add_name(sha, name, os.path.getsize(path), is_new)
+        return sha, path, is_new
+
+    def _add_name(self, sha, name, size, is_new):
+        with self._lock:
+            entry = self._manifest.setdefault(sha, {"names": [], "size": size, "added_at": time.time()})
+            if name not in entry["names"]:
+                entry["names"].append(name)
+                self._save_manifest()
+            elif is_new:
+                self._save_manifest()
+
+    def names(self, sha):
+        with self._lock:
+            return list(self._manifest.get(sha, {}).get("names", []))
+
+    def items(self):
+        """[(sha256, 路径, 第一个文件名), ...]"""
+        with self._lock:
+            return [(sha, self.path(sha), (entry["names"] or [sha])[0]) for sha, entry in self._manifest.items()]
+
+    def find_by_name(self, name):
+        with self._lock:
+            for sha, entry in self._manifest.items():
+                if name in entry["names"]:
+                    return self.path(sha)
+        return None
+
+    def resolve(self, file_path):
+        """笔记里存的路径 -> 实际存在的文件：老笔记存的是 paper_library/<文件名>，按别名找回来"""
+        if file_path and os.path.exists(file_path):
+            return file_path
+        if file_path:
+            return self.find_by_name(os.path.basename(file_path))
+        return None
+
+    def migrate_legacy(self):
+        """把以前按文件名平铺在 paper_library/ 下的 PDF 搬进内容寻址存储。返回 {旧路径: 新路径}"""
+        moved = {}
+        for old in sorted(glob.glob(os.path.join(self.root, "*.pdf"))):
+            with open(old, "rb") as f:
+                sha, path, _ = self.save(f, os.path.basename(old))
+            os.remove(old)
+            moved[old] = path
+        return moved
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._manifest),
+                "aliases": sum(len(e["names"]) for e in self._manifest.values()),
+                "bytes": sum(e["size"] for e in self._manifest.values()),
+            }
+
+
+def relink_notes(pool, moved):
+    """搬家之后，把 paper_notes.file_path 里的旧路径改成新路径"""
+    if not moved:
+        return
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("UPDATE paper_notes SET file_path = %s WHERE file_path = %s",
+                           [(new, old) for old, new in moved.items()])
+        conn.commit()
+        cursor.close()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from pdf_extract import DEFAULT_BACKEND, iter_pages
+from token_utils import count_tokens
+
+# --- PDF 文本提取缓存 ---
+# 以 PDF 字节的 SHA-256 为 key，把提取结果 (全文 + 每页起止位置和 Token 数) 存到 paper_library/.text_cache/
+# 进程重启、重新部署之后，打开看过的论文也不用再跑一遍 PyPDF2
+
+CACHE_DIR = os.path.join("paper_library", ".text_cache")
+PREVIEW_CHARS = 500  # 解析时预览首页的字数
+
+
+def pdf_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def progress_text(page_no, total, tokens):
+    """解析进度条上的文字；tokens 是 extract 逐页累加好的，不用再重算"""
+    return f"正在解析 {page_no}/{total} 页 | 已估算 {tokens:,} Token"
+
+
+def page_marker(page_no):
+    return f"\n\n--- [第 {page_no} 页] ---\n\n"
+
+
+def join_pages(pages, page_tokens=None):
+    """拼成带 [第 N 页] 标记的全文，同时记下每页在全文中的 [起, 止) 位置和 Token 数"""
+    parts = []
+    offsets = []
+    pos = 0
+    for i, (page_no, content) in enumerate(pages):
+        marker = page_marker(page_no)
+        parts.append(marker)
+        parts.append(content)
+        end = pos + len(marker) + len(content)
+        offsets.append([page_no, pos, end, page_tokens[i] if page_tokens else count_tokens(marker + content)])
+        pos = end
+    return "".join(parts), offsets
+
+
+class PdfTextCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=200 * 1024 * 1024, memory_entries=8,
+                 backend=DEFAULT_BACKEND, workers=None):
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.workers = workers
+        self.max_bytes = max_bytes  # 磁盘缓存上限，超出按最近访问时间淘汰
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # 进程内再加一层小 LRU，rerun 时连磁盘都不用读
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, sha):
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def get(self, sha):
+        with self._lock:
+            if sha in self._memory:
+                self._memory.move_to_end(sha)
+                return self._memory[sha]
+        path = self._path(sha)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # 更新访问时间，给淘汰策略用
+        self._remember(sha, entry)
+        return entry
+
+    def put(self, sha, entry):
+        path = self._path(sha)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._remember(sha, entry)
+        self._evict()
+
+    def _remember(self, sha, entry):
+        with self._lock:
+            self._memory[sha] = entry
+            self._memory.move_to_end(sha)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def extract(self, data, on_page=None, sha=None):
+        """返回 {"sha256", "text", "tokens", "pages": [[页码, 起, 止, Token 数], ...]}，命中缓存时不解析 PDF
+        on_page(页码, 总页数, 已解析的页列表, 已累计的 Token 数) 在每解析完一页时回调，用于显示进度和预览
+        已经知道 SHA-256 (比如书架存文件时算过) 就传进来，不再对整个文件重算一遍"""
+        sha = sha or pdf_sha256(data)
+        entry = self.get(sha)
+        if entry is not None and "tokens" not in entry:
+            entry = self._add_tokens(entry)  # 旧版缓存没有 Token 数，补算一次
+        if entry is None:
+            pages = []
+            page_tokens = []
+            for page_no, content, total in iter_pages(data, self.backend, self.workers):
+                if content:  # 空白页跳过
+                    pages.append((page_no, content))
+                    page_tokens.append(count_tokens(page_marker(page_no) + content))
+                if on_page:
+                    on_page(page_no, total, pages, sum(page_tokens))
+            text, offsets = join_pages(pages, page_tokens)
+            entry = {"sha256": sha, "text": text, "tokens": sum(page_tokens), "pages": offsets}
+            self.put(entry["sha256"], entry)
+        return entry
+
+    def _add_tokens(self, entry):
+        text = entry["text"]
+        pages = [[p[0], p[1], p[2], count_tokens(text[p[1]:p[2]])] for p in entry["pages"]]
+        entry = dict(entry, pages=pages, tokens=sum(p[3] for p in pages))
+        self.put(entry["sha256"], entry)
+        return entry
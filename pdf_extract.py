@@ -0,0 +1,112 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# --- PDF 逐页提取 (可并行、可换后端) ---
+# 按页码区间把 PDF 分给多个进程解析，按页序逐页 yield，界面可以边解析边显示进度和预览
+# 后端可插拔：默认 PyPDF2，装了 PyMuPDF / pypdf 的话也可以选更快的
+
+
+def _open_pypdf2(data):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return len(reader.pages), lambda i: reader.pages[i].extract_text() or ""
+
+
+def _open_pypdf(data):
+    import pypdf
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    return len(reader.pages), lambda i: reader.pages[i].extract_text() or ""
+
+
+def _open_pymupdf(data):
+    import fitz
+    doc = fitz.open(stream=data, filetype="pdf")
+    return doc.page_count, lambda i: doc[i].get_text()
+
+
+# 后端名 -> (需要的模块, 打开函数)；打开函数返回 (总页数, 按下标取某页文字的函数)
+BACKENDS = {
+    "pypdf2": ("PyPDF2", _open_pypdf2),
+    "pypdf": ("pypdf", _open_pypdf),
+    "pymupdf": ("fitz", _open_pymupdf),
+}
+DEFAULT_BACKEND = "pypdf2"
+
+
+def available_backends():
+    """只返回当前环境里装了依赖的后端"""
+    names = []
+    for name, (module, _) in BACKENDS.items():
+        try:
+            __import__(module)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    # 进程池全局复用；用 spawn 而不是 fork，避免把 Streamlit 服务进程里的线程状态复制过去
+    # 要的进程数变了就换一个池 (旧池里已提交的任务照常跑完)
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+
+_worker_doc = {}  # 子进程里最近打开的那份 PDF：(后端, 路径) -> (总页数, 取文字函数)
+
+
+def _extract_range(backend, path, start, end):
+    # 在子进程里执行：只收到临时文件路径，不用把整份 PDF 序列化过来；
+    # 同一份 PDF 在每个进程里只读取、打开一次，后面分到的页码区间直接复用
+    key = (backend, path)
+    if key not in _worker_doc:
+        with open(path, "rb") as f:
+            data = f.read()
+        _worker_doc.clear()
+        _worker_doc[key] = BACKENDS[backend][1](data)
+    total, get_text = _worker_doc[key]
+    return [(i + 1, get_text(i)) for i in range(start, min(end, total))]
+
+
+def iter_pages(data, backend=DEFAULT_BACKEND, workers=None, pages_per_task=16, parallel_threshold=32):
+    """按页序 yield (页码, 内容, 总页数)。页数少时在当前进程逐页解析，多时按页码区间分给进程池"""
+    total, get_text = BACKENDS[backend][1](data)
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    if total < parallel_threshold or workers < 2:
+        for i in range(total):
+            yield i + 1, get_text(i), total
+        return
+
+    # PDF 先落一个临时文件，子进程按路径读取
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    futures = []
+    try:
+        executor = _get_executor(workers)
+        futures = [executor.submit(_extract_range, backend, tmp.name, start, start + pages_per_task)
+                   for start in range(0, total, pages_per_task)]
+        # 按提交顺序取结果：前面的区间一好就先 yield，不用等整本解析完
+        for future in futures:
+            for page_no, content in future.result():
+                yield page_no, content, total
+    finally:
+        for future in futures:
+            future.cancel()
+        os.remove(tmp.name)
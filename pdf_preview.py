@@ -0,0 +1,43 @@
+import json
+import os
+
+# --- 笔记详情里的原始 PDF：缩略图 + 按需下载 ---
+# 以前每次选中一条笔记就把整篇 PDF 读进内存交给 download_button，没人点下载也一样
+# 现在：缩略图只渲染一次存到磁盘；下载等用户点了「准备下载」才把文件交给 download_button，下载完就放掉
+
+THUMB_DIR = os.path.join("paper_library", ".thumbs")
+DONE_FILE = "done.json"  # 全部页渲染完才写，渲染到一半中断的目录不会被当成完成
+
+
+def sha_of(path):
+    """内容寻址存储里的文件名就是 SHA-256"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def thumbnails(path, pages=3, width=180, thumb_dir=THUMB_DIR):
+    """前几页的 PNG 缩略图路径；已渲染完的直接复用。PyMuPDF 在 requirements.txt 里，万一没装就返回空列表"""
+    out_dir = os.path.join(thumb_dir, sha_of(path))
+    done_path = os.path.join(out_dir, DONE_FILE)
+    if os.path.exists(done_path):
+        with open(done_path, encoding="utf-8") as f:
+            names = json.load(f)["pages"]
+        return [os.path.join(out_dir, name) for name in names]
+    try:
+        import fitz
+    except ImportError:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    result = []
+    with fitz.open(path) as doc:
+        for i in range(min(pages, doc.page_count)):
+            page = doc[i]
+            zoom = width / page.rect.width
+            target = os.path.join(out_dir, f"{i + 1:03d}.png")
+            page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).save(target + ".tmp.png")
+            os.replace(target + ".tmp.png", target)
+            result.append(target)
+    with open(done_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"pages": [os.path.basename(p) for p in result]}, f)
+    os.replace(done_path + ".tmp", done_path)
+    return result
+
@@ -0,0 +1,43 @@
+from token_utils import count_tokens_cached
+
+# --- 阅读助手的提示词 ---
+# DeepSeek 的前缀缓存按字节比对：同一篇论文的 system prompt 在两个 app、每次会话里都必须一字不差才能命中
+# 所以指令统一写在这里 (不带缩进)，固定的指令在前、论文全文在后，两个 app 都从这里取
+
+INSTRUCTIONS = """你是一个严谨的医学科研助手。
+1. 请基于我提供的【{source}】回答问题。
+2. **必须引用原文**：在回答的关键观点后，请标注出处，例如 (见第 3 页)。
+3. 如果{where}中没有相关信息，请直接回答“文中未提及”，不要编造。
+4. 保持回答的逻辑性，使用 Markdown 格式（如列表、粗体）。
+"""
+
+FULLTEXT_PROMPT = INSTRUCTIONS.format(source="论文内容", where="论文") + "【论文全文】：\n"
+RAG_PROMPT = (INSTRUCTIONS.format(source="论文片段", where="片段")
+              + "5. 每个片段都标注了所在页码。\n【论文片段】：\n")
+LIBRARY_PROMPT = (INSTRUCTIONS.format(source="文献库片段", where="片段")
+                  + "5. 片段来自多篇论文和笔记，引用时写明论文名和页码，例如 (《xxx》第 3 页)。\n【文献库片段】：\n")
+
+
+def _canonical(text):
+    # 统一换行、去掉首尾空白，同一份内容无论从哪里读出来都得到相同的字节
+    return text.replace("\r\n", "\n").strip()
+
+
+def fulltext_system_message(paper_text):
+    """全文模式：整条 system 消息只由论文内容决定，是可以被缓存的前缀"""
+    return {"role": "system", "content": FULLTEXT_PROMPT + _canonical(paper_text)}
+
+
+def rag_system_message(context):
+    """检索模式：固定指令在前，检索到的片段在后 (片段每次不同，只有指令部分能命中缓存)"""
+    return {"role": "system", "content": RAG_PROMPT + _canonical(context)}
+
+
+def library_system_message(context):
+    """全库问答：片段来自整个书架 (多篇论文 + 笔记)"""
+    return {"role": "system", "content": LIBRARY_PROMPT + _canonical(context)}
+
+
+def fulltext_overhead_tokens():
+    """全文模式下指令部分的 Token 数，加上论文的 Token 数就是整条 system 消息的"""
+    return count_tokens_cached(FULLTEXT_PROMPT)
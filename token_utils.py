@@ -0,0 +1,50 @@
+from functools import lru_cache
+
+import tiktoken
+
+# --- Token 计数 ---
+# 编码器全局只加载一次；论文的 Token 数随提取缓存一起存盘 (见 pdf_cache)；
+# 聊天记录只给新增的消息计数，rerun 时几乎不花时间
+
+CONTEXT_LIMIT = 64000  # DeepSeek 最大上下文
+MESSAGE_OVERHEAD = 4  # 每条消息的角色 / 分隔符开销 (按 OpenAI 的计法估算)
+REPLY_PRIMING = 3  # 回复开头的固定开销
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    # 使用 cl100k_base 编码器 (目前大多数先进模型通用的编码标准)
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    """计算文本的 Token 数量"""
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=256)
+def count_tokens_cached(text):
+    """给不常变的短文本 (系统指令模板等) 用，同一段文字只数一次"""
+    return count_tokens(text)
+
+
+class ChatTokenLedger:
+    """记账式统计聊天记录的 Token：chat_history 只会往后追加，所以只需要给新消息计数"""
+
+    def __init__(self):
+        self._history_id = None
+        self._counts = []
+
+    def history_tokens(self, history, start=0):
+        """history[start:] 的 Token 数 (start 之前的记录已被压缩成摘要，不再发送)"""
+        # 换了论文 (列表被替换) 或记录被压缩变短，就从头重算
+        if id(history) != self._history_id or len(history) < len(self._counts):
+            self._history_id = id(history)
+            self._counts = []
+        for msg in history[len(self._counts):]:
+            self._counts.append(count_tokens(msg["content"]) + MESSAGE_OVERHEAD)
+        return sum(self._counts[start:])
+
+    def payload_tokens(self, system_tokens, history, start=0):
+        """整个请求 (system + 历史记录) 的 Token 数"""
+        return system_tokens + MESSAGE_OVERHEAD + self.history_tokens(history, start) + REPLY_PRIMING
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+# --- 前缀缓存命中统计 ---
+# 每次阅读问答后，把 DeepSeek 返回的 prompt_cache_hit_tokens / prompt_cache_miss_tokens 按论文记到 TiDB 的 llm_usage 表
+# 侧边栏据此显示命中率和省下的钱，跨会话、跨 app 都能看出缓存到底有没有生效
+
+# 每百万 Token 的价格 (美元)，可在 secrets.toml 里用 deepseek_prices 覆盖
+DEFAULT_PRICES = {"hit": 0.028, "miss": 0.28, "output": 0.42}
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    log_time DATETIME NOT NULL,
+    app VARCHAR(64) NOT NULL,
+    paper_sha CHAR(64) NOT NULL,
+    paper_name VARCHAR(255),
+    prompt_tokens INT NOT NULL,
+    cache_hit_tokens INT NOT NULL,
+    cache_miss_tokens INT NOT NULL,
+    completion_tokens INT NOT NULL,
+    KEY idx_llm_usage_log_time (log_time),
+    KEY idx_llm_usage_paper (paper_sha)
+)
+"""
+
+
+def ensure_usage_table(pool):
+    """建表 (已存在则跳过)，只需在进程启动时执行一次"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TABLE_SQL)
+        conn.commit()
+        cursor.close()
+
+
+def record_usage(pool, app, paper_sha, paper_name, usage):
+    """记一次问答的 Token 用量；usage 是 OpenAI SDK 返回的 usage 对象"""
+    hit = getattr(usage, "prompt_cache_hit_tokens", 0) or 0
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if miss is None:
+        miss = usage.prompt_tokens - hit
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO llm_usage (log_time, app, paper_sha, paper_name, prompt_tokens, "
+            "cache_hit_tokens, cache_miss_tokens, completion_tokens) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (datetime.now(), app, paper_sha, paper_name, usage.prompt_tokens, hit, miss, usage.completion_tokens),
+        )
+        conn.commit()
+        cursor.close()
+
+
+def saved_dollars(hit_tokens, prices=DEFAULT_PRICES):
+    """命中缓存的 Token 按「未命中价 - 命中价」算省下的钱"""
+    return hit_tokens * (prices["miss"] - prices["hit"]) / 1_000_000
+
+
+def _rows(pool, sql, params, int_keys):
+    with pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    # SUM 返回的是 Decimal，转成 int 方便 pandas 画图
+    return [dict(row, **{k: int(row[k] or 0) for k in int_keys}) for row in rows]
+
+
+def query_daily_usage(pool, days=30):
+    """最近 N 天按天汇总的命中 / 未命中 Token"""
+    since = datetime.now() - timedelta(days=days)
+    return _rows(pool,
+                 "SELECT DATE(log_time) AS day, SUM(cache_hit_tokens) AS hit, SUM(cache_miss_tokens) AS miss, "
+                 "SUM(completion_tokens) AS output, COUNT(*) AS calls "
+                 "FROM llm_usage WHERE log_time >= %s GROUP BY DATE(log_time) ORDER BY day",
+                 (since,), ("hit", "miss", "output", "calls"))
+
+
+def query_paper_usage(pool, days=30, limit=10):
+    """最近 N 天用量最大的几篇论文各自的命中情况"""
+    since = datetime.now() - timedelta(days=days)
+    return _rows(pool,
+                 "SELECT MAX(paper_name) AS paper_name, SUM(cache_hit_tokens) AS hit, SUM(cache_miss_tokens) AS miss, "
+                 "COUNT(*) AS calls FROM llm_usage WHERE log_time >= %s "
+                 "GROUP BY paper_sha ORDER BY SUM(prompt_tokens) DESC LIMIT %s",
+                 (since, limit), ("hit", "miss", "calls"))
+
+
+def load_usage(pool, days=30):
+    """(按天汇总, 按论文汇总)，两个 app 的侧边栏共用"""
+    return query_daily_usage(pool, days), query_paper_usage(pool, days)
+
+
+def hit_rate(hit, miss):
+    return hit / (hit + miss) if hit + miss else None
+
+
+def summarize_usage(daily, papers, prices=DEFAULT_PRICES):
+    """把查询结果整理成侧边栏要显示的数字：总命中率、省下的钱、每天的命中率、每篇论文一行"""
+    hit = sum(r["hit"] for r in daily)
+    miss = sum(r["miss"] for r in daily)
+    return {
+        "hit_rate": hit_rate(hit, miss),
+        "saved": saved_dollars(hit, prices),
+        "daily_rate": {r["day"]: hit_rate(r["hit"], r["miss"]) or 0.0 for r in daily},
+        "papers": [{
+            "论文": p["paper_name"],
+            "命中率": f"{hit_rate(p['hit'], p['miss']) or 0.0:.0%}",
+            "调用": p["calls"],
+        } for p in papers],
+    }